@@ -0,0 +1,96 @@
+import datetime
+import glob
+import os
+
+import pandas as pd
+
+from cassandra_client import utc_now
+
+# Historical aggregations over the parquet sink's copy of created_users (partitioned by ingest_date), so
+# the dashboard's group-bys scan columnar files instead of Cassandra. Queries run on DuckDB when it is
+# installed and on pyarrow.dataset otherwise; both read only the columns a chart needs and skip the
+# ingest_date directories outside the requested period.
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'analytics', 'created_users')
+
+# dimension: (source column, DuckDB expression, pandas equivalent), matching spark_stream.aggregate_dimensions
+DIMENSIONS = {
+    'gender': ('gender', "gender", lambda values: values),
+    'email_domain': ('email', "split_part(email, '@', -1)", lambda values: values.str.split('@').str[-1]),
+    'registered_year': ('registered_date', "substr(registered_date, 1, 4)", lambda values: values.str[:4]),
+}
+
+
+def has_data(path=DEFAULT_PATH):
+    return bool(glob.glob(os.path.join(path, 'ingest_date=*', '*.parquet')))
+
+
+def engine():
+    try:
+        import duckdb
+        return 'duckdb'
+    except ImportError:
+        return 'pyarrow'
+
+
+def duckdb_query(path, sql, params):
+    import duckdb
+
+    # a connection per query: the dashboard queries from several threads and connections are not shared
+    source = f"read_parquet('{os.path.join(path, 'ingest_date=*', '*.parquet')}', hive_partitioning = true, " \
+             f"union_by_name = true)"
+    with duckdb.connect() as connection:
+        return connection.execute(sql.format(source=source), params).df()
+
+
+def arrow_table(path, columns, filter_expression=None):
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    partitioning = ds.partitioning(pa.schema([('ingest_date', pa.date32())]), flavor='hive')
+    dataset = ds.dataset(path, format='parquet', partitioning=partitioning)
+    return dataset.to_table(columns=columns, filter=filter_expression).to_pandas()
+
+
+def period_start(period_days):
+    return None if period_days is None else (utc_now() - datetime.timedelta(days=period_days)).date()
+
+
+def dimension_counts(dimension, period_days=None, path=DEFAULT_PATH):
+    # same shape as chart_data.dimension_counts: value -> rows, optionally only rows ingested in the period
+    column, expression, transform = DIMENSIONS[dimension]
+    since = period_start(period_days)
+
+    if engine() == 'duckdb':
+        where = "WHERE ingest_date >= ?" if since else ""
+        df = duckdb_query(path, f"SELECT coalesce({expression}, 'Unknown') AS value, count(*) AS row_count "
+                                f"FROM {{source}} {where} GROUP BY 1", [since] if since else [])
+        counts = pd.Series(df['row_count'].values, index=df['value'].values, dtype='int64')
+    else:
+        import pyarrow.dataset as ds
+
+        values = arrow_table(path, [column], ds.field('ingest_date') >= since if since else None)[column]
+        counts = transform(values).fillna('Unknown').value_counts().astype('int64')
+    return counts[counts > 0]
+
+
+def ingest_series(window_minutes, path=DEFAULT_PATH):
+    # same shape as chart_data.ingest_series: records per minute over the window, zero-filled
+    end = utc_now().replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+    start = end - datetime.timedelta(minutes=window_minutes)
+
+    if engine() == 'duckdb':
+        df = duckdb_query(path, "SELECT date_trunc('minute', kafka_timestamp) AS minute, count(*) AS row_count "
+                                "FROM {source} WHERE ingest_date >= ? AND kafka_timestamp >= ? "
+                                "AND kafka_timestamp < ? GROUP BY 1",
+                          [start.date(), start, end])
+        counts = pd.Series(df['row_count'].values, index=pd.to_datetime(df['minute']), dtype='int64')
+    else:
+        import pyarrow.dataset as ds
+
+        timestamps = arrow_table(path, ['kafka_timestamp'], ds.field('ingest_date') >= start.date())['kafka_timestamp']
+        timestamps = timestamps[(timestamps >= start) & (timestamps < end)]
+        counts = timestamps.dt.floor('min').value_counts().astype('int64')
+
+    index = pd.date_range(start, end, freq='min', inclusive='left')
+    return counts.reindex(index, fill_value=0)
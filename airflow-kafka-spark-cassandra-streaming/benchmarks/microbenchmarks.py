@@ -0,0 +1,188 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import timeit
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path[:0] = [PROJECT_DIR, os.path.join(PROJECT_DIR, 'dags')]
+
+from payloads import load_api_results, load_api_responses
+from user_producer import format_data
+
+# Per-record CPU cost of the producer and parsing hot paths, measured on payloads rebuilt from
+# cassandra_backup_data.csv. Each benchmark reports the best of --repeat runs in microseconds per record
+# and its ratio to a stdlib-only reference timed in alternating passes, so both see the same machine load.
+# thresholds.json holds the ratios rather than times, so it carries over between machines: a ratio more than
+# `headroom` times the recorded one, or a benchmark with no recorded ratio, fails the run (exit code 1).
+# --update-thresholds records the current ratios.
+
+THRESHOLDS_FILE = os.path.join(BENCHMARK_DIR, 'thresholds.json')
+# json round trip of the API results: scales with the machine and interpreter, not with this repo's code
+REFERENCE = 'reference_json_roundtrip'
+# allowed slowdown over the recorded ratio; ratios still shift somewhat between CPUs and python versions
+DEFAULT_HEADROOM = 2.0
+
+
+def serializers():
+    # the producer's serializer and the alternatives worth switching to; optional ones only if installed
+    candidates = {
+        'json_dumps': lambda data: json.dumps(data).encode('utf-8'),
+        'json_dumps_compact': lambda data: json.dumps(data, separators=(',', ':')).encode('utf-8'),
+    }
+    try:
+        import orjson
+        candidates['orjson_dumps'] = orjson.dumps
+    except ImportError:
+        pass
+    try:
+        import ujson
+        candidates['ujson_dumps'] = lambda data: ujson.dumps(data).encode('utf-8')
+    except ImportError:
+        pass
+    return candidates
+
+
+def reference_pass(api_results):
+    def one_pass():
+        for result in api_results:
+            json.loads(json.dumps(result))
+
+    return one_pass
+
+
+def run_per_record(function, inputs, reference, repeat):
+    # `repeat` passes over all inputs, each after a pass of the reference: the best (least disturbed) pass
+    # in microseconds per record, and the median of the pass / reference pass ratios
+    def one_pass():
+        for item in inputs:
+            function(item)
+
+    pairs = [(timeit.timeit(reference, number=1), timeit.timeit(one_pass, number=1)) for _ in range(repeat)]
+    best = min(seconds for _, seconds in pairs)
+    return best / len(inputs) * 1e6, statistics.median(seconds / reference_seconds
+                                                       for reference_seconds, seconds in pairs)
+
+
+def python_benchmarks(records, repeat):
+    api_results = load_api_results(records)
+    responses = load_api_responses(records)
+    formatted = [format_data(result) for result in api_results]
+    reference = reference_pass(api_results)
+
+    results = {
+        REFERENCE: run_per_record(lambda result: json.loads(json.dumps(result)), api_results, reference, repeat),
+        # get_data: response body -> result dict (what requests' .json() does)
+        'get_data_parse': run_per_record(lambda body: json.loads(body)['results'][0], responses, reference, repeat),
+        'format_data': run_per_record(format_data, api_results, reference, repeat),
+    }
+    for name, serialize in serializers().items():
+        results[f'serialize_{name}'] = run_per_record(serialize, formatted, reference, repeat)
+    results['produce_path'] = run_per_record(lambda result: json.dumps(format_data(result)).encode('utf-8'),
+                                             api_results, reference, repeat)
+    return results
+
+
+def spark_benchmarks(records, repeat):
+    # from_json and validation over a batch in local mode; per-record cost includes spark's batch overhead,
+    # so compare it between runs rather than with the python numbers
+    import spark_stream
+    from pipeline_benchmark import create_benchmark_spark_session, kafka_source_schema
+
+    spark = create_benchmark_spark_session('local[*]')
+    try:
+        now = datetime.datetime.now()
+        rows = [(json.dumps(format_data(result)).encode('utf-8'), 'users_data', 0, offset, now)
+                for offset, result in enumerate(load_api_results(records))]
+        kafka_df = spark.createDataFrame(rows, kafka_source_schema()).cache()
+        kafka_df.count()
+
+        def parse():
+            selection_df = spark_stream.create_selection_df_from_kafka(kafka_df)
+            spark_stream.split_valid_invalid(selection_df)[0].write.format('noop').mode('overwrite').save()
+
+        parse()  # warm up the JVM code paths
+        reference = reference_pass(load_api_results(records))
+        pairs = [(timeit.timeit(reference, number=1), timeit.timeit(parse, number=1)) for _ in range(repeat)]
+        best = min(seconds for _, seconds in pairs)
+        return {'spark_from_json': (best / records * 1e6, statistics.median(seconds / reference_seconds
+                                                                            for reference_seconds, seconds in pairs))}
+    finally:
+        spark.stop()
+
+
+def check(ratios, thresholds):
+    headroom = thresholds.get('headroom', DEFAULT_HEADROOM)
+    failures = []
+    for name, ratio in ratios.items():
+        recorded = thresholds['ratios'].get(name)
+        if recorded is None:
+            # an unchecked benchmark would pass however slow it gets
+            failures.append(f"{name}: no recorded ratio in thresholds.json; record one with --update-thresholds"
+                            f"{' --spark' if name.startswith('spark_') else ''} on a machine that can run it")
+        elif ratio > recorded * headroom:
+            failures.append(f"{name}: {ratio:.3f}x the reference is above the threshold of "
+                            f"{recorded * headroom:.3f}x ({recorded:.3f}x recorded, x{headroom} headroom)")
+    return failures
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Microbenchmarks of format_data, serialization and from_json.')
+    parser.add_argument('--records', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--spark', action='store_true', help='also time the spark from_json parse (needs pyspark)')
+    parser.add_argument('--update-thresholds', action='store_true',
+                        help='record the ratios to the reference in thresholds.json instead of checking')
+    parser.add_argument('--output', help='write the JSON result here as well')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    measured = python_benchmarks(args.records, args.repeat)
+    if args.spark:
+        measured.update(spark_benchmarks(args.records, args.repeat))
+    results = {name: round(value, 3) for name, (value, _) in measured.items()}
+    ratios = {name: round(ratio, 4) for name, (_, ratio) in measured.items() if name != REFERENCE}
+
+    report = {
+        'benchmark': 'micro',
+        'unit': 'us/record',
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'records': args.records,
+        'results': results,
+        'ratios_to_reference': ratios,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+    if args.update_thresholds:
+        thresholds = {'reference': REFERENCE, 'headroom': DEFAULT_HEADROOM, 'ratios': {}}
+        if os.path.exists(THRESHOLDS_FILE):
+            with open(THRESHOLDS_FILE) as f:
+                thresholds = json.load(f)
+        thresholds['ratios'].update(ratios)
+        thresholds['ratios'] = dict(sorted(thresholds['ratios'].items()))
+        with open(THRESHOLDS_FILE, 'w') as f:
+            json.dump(thresholds, f, indent=2)
+            f.write('\n')
+        return
+
+    with open(THRESHOLDS_FILE) as f:
+        failures = check(ratios, json.load(f))
+    if failures:
+        print('\n'.join(failures), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
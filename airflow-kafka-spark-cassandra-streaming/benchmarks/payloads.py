@@ -0,0 +1,67 @@
+import csv
+import hashlib
+import json
+import os
+
+BACKUP_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cassandra_backup_data.csv')
+
+
+def backup_row_to_api_result(row):
+    # Rebuilds the randomuser.me result a backup row came from, including the fields format_data drops,
+    # so payload sizes and parse costs match the real API. "<number> <street>, <city>, <state>, <country>"
+    # is the address format_data writes; the city itself may contain commas.
+    parts = row['address'].split(', ')
+    number, _, street = parts[0].partition(' ')
+    registered_year = int(row['registered_date'][:4])
+    digest = hashlib.sha256(row['id'].encode('utf-8')).hexdigest()
+
+    return {
+        'gender': row['gender'],
+        'name': {'title': 'Mr' if row['gender'] == 'male' else 'Ms', 'first': row['first_name'], 'last': row['last_name']},
+        'location': {
+            'street': {'number': int(number) if number.isdigit() else number, 'name': street},
+            'city': ', '.join(parts[1:-2]),
+            'state': parts[-2] if len(parts) > 2 else '',
+            'country': parts[-1],
+            'postcode': row['post_code'],
+            'coordinates': {'latitude': '-61.1546', 'longitude': '-82.3548'},
+            'timezone': {'offset': '+1:00', 'description': 'Brussels, Copenhagen, Madrid, Paris'},
+        },
+        'email': row['email'],
+        'login': {
+            'uuid': row['id'],
+            'username': row['username'],
+            'password': digest[:8],
+            'salt': digest[8:16],
+            'md5': digest[:32],
+            'sha1': digest[:40],
+            'sha256': digest,
+        },
+        'dob': {'date': f"{registered_year - 30}-06-15T08:30:00.000Z", 'age': 30},
+        'registered': {'date': row['registered_date'], 'age': 2024 - registered_year},
+        'phone': row['phone'],
+        'cell': row['phone'],
+        'id': {'name': '', 'value': None},
+        'picture': {
+            'large': row['picture'].replace('/med/', '/'),
+            'medium': row['picture'],
+            'thumbnail': row['picture'].replace('/med/', '/thumb/'),
+        },
+        'nat': 'GB',
+    }
+
+
+def load_api_results(limit=None, path=BACKUP_CSV):
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    if limit is not None:
+        # cycle through the backup when more records are asked for than it holds
+        rows = [rows[i % len(rows)] for i in range(limit)]
+    return [backup_row_to_api_result(row) for row in rows]
+
+
+def load_api_responses(limit=None, path=BACKUP_CSV):
+    # raw response bodies as get_data receives them
+    return [json.dumps({'results': [result], 'info': {'seed': result['login']['salt'], 'results': 1, 'page': 1,
+                                                      'version': '1.4'}}).encode('utf-8')
+            for result in load_api_results(limit, path)]
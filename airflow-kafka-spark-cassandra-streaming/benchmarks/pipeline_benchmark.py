@@ -0,0 +1,352 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path[:0] = [PROJECT_DIR, os.path.join(PROJECT_DIR, 'dags')]
+
+import spark_stream
+from payloads import load_api_results
+from user_producer import format_data
+
+# End-to-end benchmark of the pipeline's own code: the producer (format_data + serialization), the Spark
+# parsing path (create_selection_df_from_kafka -> split_valid_invalid -> apply_projection) in local mode
+# and the partition writer. Records flow through the stages in micro-batches like they do in production.
+# Kafka and Cassandra are in-process stand-ins unless --kafka-bootstrap / --cassandra-host point at real
+# ones (e.g. the docker-compose services). Results are written as JSON so runs can be compared.
+
+TOPIC = 'users_data_benchmark'
+
+
+class InProcessBroker:
+    # Stand-in for a single-partition Kafka topic: an in-memory append-only log behind the
+    # KafkaProducer.send / flush subset the producer uses.
+
+    def __init__(self):
+        self.log = []
+
+    def send(self, topic, value=None, key=None):
+        self.log.append((value, topic, 0, len(self.log), datetime.datetime.now()))
+
+    def flush(self):
+        pass
+
+    def read(self, start, end):
+        return self.log[start:end]
+
+    def close(self):
+        pass
+
+
+class KafkaBroker:
+    # A real broker: produces with kafka-python and reads the batch back from the same offsets so the
+    # Spark stage sees broker timestamps and offsets.
+
+    def __init__(self, bootstrap_servers, topic):
+        from kafka import KafkaProducer, KafkaConsumer, TopicPartition
+
+        self.producer = KafkaProducer(bootstrap_servers=bootstrap_servers, max_block_ms=5000, linger_ms=5)
+        self.consumer = KafkaConsumer(bootstrap_servers=bootstrap_servers, enable_auto_commit=False, group_id=None)
+        self.partition = TopicPartition(topic, 0)
+        self.producer.partitions_for(topic)
+        self.consumer.assign([self.partition])
+        self.consumer.seek_to_end(self.partition)
+        self.start_offset = self.consumer.position(self.partition)
+
+    def send(self, topic, value=None, key=None):
+        self.producer.send(topic, value, partition=0)
+
+    def flush(self):
+        self.producer.flush()
+
+    def read(self, start, end):
+        records = []
+        self.consumer.seek(self.partition, self.start_offset + start)
+        while len(records) < end - start:
+            for batch in self.consumer.poll(timeout_ms=1000).values():
+                records.extend((r.value, r.topic, r.partition, r.offset,
+                                datetime.datetime.fromtimestamp(r.timestamp / 1000)) for r in batch)
+        return records[:end - start]
+
+    def close(self):
+        self.producer.close()
+        self.consumer.close()
+
+
+class MockFuture:
+
+    def __init__(self, pool, latency_seconds):
+        self.pool = pool
+        self.latency_seconds = latency_seconds
+
+    def add_callbacks(self, callback, errback, callback_args=(), errback_args=()):
+        def complete():
+            time.sleep(self.latency_seconds)
+            callback(None, *callback_args)
+
+        self.pool.submit(complete)
+
+
+class MockSession:
+    # Stand-in for a Cassandra session: every write completes on a driver-like thread pool after a
+    # latency drawn around `latency_ms`, so the partition writer's concurrency control is exercised.
+
+    def __init__(self, latency_ms, threads):
+        self.latency_ms = latency_ms
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+        self.random = random.Random(0)
+        self.lock = threading.Lock()
+
+    def prepare(self, cql):
+        return cql
+
+    def execute_async(self, statement, values):
+        with self.lock:
+            latency = self.random.expovariate(1 / self.latency_ms) / 1000 if self.latency_ms else 0
+        return MockFuture(self.pool, latency)
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def summarize(records, seconds, latencies_ms, peak_bytes):
+    return {
+        'records': records,
+        'seconds': round(seconds, 4),
+        'records_per_second': round(records / seconds, 1) if seconds else None,
+        'latency_ms': {
+            'p50': percentile(latencies_ms, 50),
+            'p99': percentile(latencies_ms, 99),
+        },
+        'python_peak_memory_mb': round(peak_bytes / 2 ** 20, 2) if peak_bytes is not None else None,
+    }
+
+
+class StageTimer:
+    # wall time and (optionally) the python heap peak of one stage, accumulated over batches
+
+    def __init__(self, trace_memory):
+        self.trace_memory = trace_memory
+        self.seconds = 0.0
+        self.peak_bytes = 0 if trace_memory else None
+
+    def __enter__(self):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            self.baseline = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds += time.perf_counter() - self.start
+        if self.trace_memory:
+            self.peak_bytes = max(self.peak_bytes, tracemalloc.get_traced_memory()[1] - self.baseline)
+
+
+def create_benchmark_spark_session(master):
+    from pyspark.sql import SparkSession
+
+    # no connector packages: the benchmark only runs the parsing path, the writer is driven directly
+    spark = SparkSession.builder \
+        .master(master) \
+        .appName('PipelineBenchmark') \
+        .config('spark.sql.shuffle.partitions', '4') \
+        .config('spark.ui.enabled', 'false') \
+        .getOrCreate()
+    spark.sparkContext.setLogLevel('ERROR')
+    return spark
+
+
+def kafka_source_schema():
+    from pyspark.sql.types import StructType, StructField, BinaryType, StringType, IntegerType, LongType, \
+        TimestampType
+
+    # the columns of spark's kafka source that the job reads
+    return StructType([
+        StructField('value', BinaryType()),
+        StructField('topic', StringType()),
+        StructField('partition', IntegerType()),
+        StructField('offset', LongType()),
+        StructField('timestamp', TimestampType()),
+    ])
+
+
+def create_cassandra_session(args):
+    if not args.cassandra_host:
+        return MockSession(args.mock_write_latency_ms, args.mock_write_threads), 'in-process mock'
+
+    session = spark_stream.get_executor_session([args.cassandra_host])
+    spark_stream.create_keyspace(session)
+    spark_stream.create_table(session)
+    return session, f'cassandra at {args.cassandra_host}'
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=PROJECT_DIR, capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(args):
+    if args.kafka_bootstrap:
+        broker, broker_backend = KafkaBroker(args.kafka_bootstrap, TOPIC), f'kafka at {args.kafka_bootstrap}'
+    else:
+        broker, broker_backend = InProcessBroker(), 'in-process log'
+    session, cassandra_backend = create_cassandra_session(args)
+    spark = create_benchmark_spark_session(args.spark_master)
+    schema = kafka_source_schema()
+
+    api_results = load_api_results(args.records)
+    trace_memory = not args.no_memory
+    if trace_memory:
+        tracemalloc.start()
+
+    producer_timer, spark_timer, write_timer = (StageTimer(trace_memory) for _ in range(3))
+    produce_latencies, spark_latencies, end_to_end = [], [], []
+    write_stats = spark_stream.empty_write_stats()
+    columns_synced = False
+    written = 0
+
+    for batch_start in range(0, len(api_results), args.batch_size):
+        batch = api_results[batch_start:batch_start + args.batch_size]
+
+        # producer: the work stream_data does per record once the api response is in
+        produced_at = []
+        with producer_timer:
+            for result in batch:
+                start = time.perf_counter()
+                broker.send(TOPIC, json.dumps(format_data(result)).encode('utf-8'))
+                produced_at.append(start)
+                produce_latencies.append((time.perf_counter() - start) * 1000)
+            broker.flush()
+
+        # spark: one micro-batch through the job's parsing and projection
+        records = broker.read(batch_start, batch_start + len(batch))
+        with spark_timer:
+            start = time.perf_counter()
+            selection_df = spark_stream.create_selection_df_from_kafka(spark.createDataFrame(records, schema))
+            valid_df, _ = spark_stream.split_valid_invalid(selection_df)
+            main_df, _ = spark_stream.apply_projection(spark_stream.drop_trace_columns(valid_df),
+                                                       spark_stream.DEFAULT_PROJECTION)
+            rows = main_df.collect()
+            spark_latencies.append((time.perf_counter() - start) * 1000)
+
+        if not columns_synced and args.cassandra_host:
+            spark_stream.sync_table_columns(session, 'created_users', main_df.schema)
+            columns_synced = True
+
+        # writer: the partition writer the job's 'partition' sink mode runs on every executor
+        with write_timer:
+            statement = spark_stream.get_prepared_insert(session, 'created_users', main_df.columns)
+            writer = spark_stream.PartitionWriter(session, statement, args.max_concurrency,
+                                                  max_retries=3, backoff_seconds=0.05)
+            for row in rows:
+                writer.submit(tuple(row))
+            writer.flush()
+        spark_stream.WriteStatsParam().addInPlace(write_stats, writer.stats)
+        written += len(rows)
+
+        done = time.perf_counter()
+        end_to_end.extend((done - start) * 1000 for start in produced_at)
+
+    if trace_memory:
+        tracemalloc.stop()
+    broker.close()
+    spark.stop()
+
+    write_summary = summarize(written, write_timer.seconds, [], write_timer.peak_bytes)
+    write_summary['latency_ms'] = {'p50': spark_stream.latency_percentile(write_stats, 50),
+                                   'p99': spark_stream.latency_percentile(write_stats, 99)}
+    write_summary['retries'] = write_stats['retries']
+
+    total_seconds = producer_timer.seconds + spark_timer.seconds + write_timer.seconds
+    return {
+        'benchmark': 'pipeline',
+        'started_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': vars(args),
+        'backends': {'kafka': broker_backend, 'cassandra': cassandra_backend, 'spark': args.spark_master},
+        'stages': {
+            # per-record latency for the producer and writer, per-batch latency for spark
+            'producer': summarize(len(api_results), producer_timer.seconds, produce_latencies,
+                                  producer_timer.peak_bytes),
+            'spark_parse': summarize(len(api_results), spark_timer.seconds, spark_latencies, spark_timer.peak_bytes),
+            'cassandra_write': write_summary,
+        },
+        'end_to_end': {
+            'records': written,
+            'records_per_second': round(written / total_seconds, 1) if total_seconds else None,
+            'latency_ms': {'p50': percentile(end_to_end, 50), 'p99': percentile(end_to_end, 99)},
+        },
+    }
+
+
+def compare(result, baseline):
+    # throughput change per stage against an earlier result file
+    lines = []
+    stages = dict(result['stages'], end_to_end=result['end_to_end'])
+    baseline_stages = dict(baseline['stages'], end_to_end=baseline['end_to_end'])
+    for name, stage in stages.items():
+        before = baseline_stages.get(name, {}).get('records_per_second')
+        after = stage['records_per_second']
+        if before and after:
+            lines.append(f"{name:16} {before:>12,.1f} -> {after:>12,.1f} records/s ({(after / before - 1) * 100:+.1f}%)")
+    return '\n'.join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='End-to-end benchmark of the producer, spark parsing and '
+                                                 'cassandra writer using records from cassandra_backup_data.csv.')
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--batch-size', type=int, default=2000, help='records per spark micro-batch')
+    parser.add_argument('--spark-master', default='local[*]')
+    parser.add_argument('--kafka-bootstrap', help='use a real broker instead of the in-process log')
+    parser.add_argument('--cassandra-host', help='write to a real cassandra instead of the in-process mock')
+    parser.add_argument('--mock-write-latency-ms', type=float, default=1.0)
+    parser.add_argument('--mock-write-threads', type=int, default=8)
+    parser.add_argument('--max-concurrency', type=int, default=64, help='writer in-flight limit')
+    parser.add_argument('--no-memory', action='store_true', help='skip tracemalloc (it slows allocation-heavy stages)')
+    parser.add_argument('--output', help='write the JSON result here instead of stdout')
+    parser.add_argument('--compare', help='earlier JSON result to compare throughput against')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    result = run(args)
+
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare(result, json.load(f)), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,367 @@
+import atexit
+import datetime
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from cassandra import OperationTimedOut
+from cassandra.cluster import Cluster, NoHostAvailable, ExecutionProfile, EXEC_PROFILE_DEFAULT
+from cassandra.concurrent import execute_concurrent_with_args
+
+# every query the dashboard runs, prepared once per session
+QUERIES = {
+    'counter_count': "SELECT row_count FROM spark_streams.row_counts WHERE table_name = ?",
+    'size_estimates': "SELECT partitions_count FROM system.size_estimates "
+                      "WHERE keyspace_name = ? AND table_name = ?",
+    'range_count': "SELECT count(*) FROM spark_streams.created_users WHERE token(id) > ? AND token(id) <= ?",
+    'latest_ingest': "SELECT ingest_ts FROM spark_streams.recent_users_by_hour WHERE ingest_hour = ? LIMIT 1",
+    'dimension_counts': "SELECT value, row_count FROM spark_streams.user_counts_by_dimension WHERE dimension = ?",
+    'ingest_minutes': "SELECT minute, row_count FROM spark_streams.ingest_counts_by_minute "
+                      "WHERE ingest_day = ? AND minute >= ? AND minute < ?",
+    'search_prefix': "SELECT value, id, username, first_name, last_name, email FROM spark_streams.users_by_prefix "
+                     "WHERE field = ? AND bucket = ? AND value >= ? AND value < ?",
+    # equality lookups through the SAI indexes on created_users
+    'search_email': "SELECT id, username, first_name, last_name, email, registered_date "
+                    "FROM spark_streams.created_users WHERE email = ?",
+    'search_username': "SELECT id, username, first_name, last_name, email, registered_date "
+                       "FROM spark_streams.created_users WHERE username = ?",
+    'search_last_name': "SELECT id, username, first_name, last_name, email, registered_date "
+                        "FROM spark_streams.created_users WHERE last_name = ?",
+    'recent_since': "SELECT ingest_ts, id, username, first_name, gender, email, registered_date "
+                    "FROM spark_streams.recent_users_by_hour WHERE ingest_hour = ? AND ingest_ts > ?",
+}
+
+# Murmur3Partitioner token ring
+MIN_TOKEN = -2 ** 63
+MAX_TOKEN = 2 ** 63 - 1
+
+# execution profile whose pages come back as DataFrames, used by the readers
+PANDAS_PROFILE = 'pandas'
+
+# low-cardinality text columns stored as pandas categoricals
+CATEGORY_COLUMNS = ['gender', 'email_domain', 'country', 'state']
+DATETIME_COLUMNS = ['registered_date']
+
+def pandas_factory(column_names, rows):
+    # builds each page straight into a DataFrame instead of one namedtuple per row
+    return pd.DataFrame.from_records(rows, columns=column_names)
+
+
+def optimize_user_frame(df):
+    # parse dates once at load, derive the email domain with vectorized string ops and
+    # keep low-cardinality columns as categoricals
+    for column in DATETIME_COLUMNS:
+        if column in df.columns:
+            df[column] = pd.to_datetime(df[column], utc=True, errors='coerce')
+
+    if 'email' in df.columns:
+        df['email_domain'] = df['email'].str.split('@').str[-1].fillna('Unknown')
+
+    for column in CATEGORY_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+
+    return df
+
+
+# errors that mean the connection itself is gone rather than the query being wrong
+CONNECTION_ERRORS = (NoHostAvailable, OperationTimedOut)
+
+
+class CassandraClient:
+    # One cluster/session shared by every dashboard rerun. The connection is health-checked at most
+    # every `health_check_interval` seconds and rebuilt if it died; it is shut down when the process exits.
+
+    def __init__(self, hosts, port=9042, queries=QUERIES, health_check_interval=10, connect_timeout=5):
+        self.hosts = hosts
+        self.port = port
+        self.queries = queries
+        self.health_check_interval = health_check_interval
+        self.connect_timeout = connect_timeout
+
+        self.cluster = None
+        self.session = None
+        self.prepared = {}
+        self.last_health_check = 0.0
+        self.lock = threading.Lock()
+
+        atexit.register(self.shutdown)
+
+    def connect(self):
+        self.cluster = Cluster(self.hosts, port=self.port, connect_timeout=self.connect_timeout,
+                               execution_profiles={
+                                   EXEC_PROFILE_DEFAULT: ExecutionProfile(),
+                                   PANDAS_PROFILE: ExecutionProfile(row_factory=pandas_factory),
+                               })
+        self.session = self.cluster.connect()
+        self.prepared = {}
+        self.last_health_check = time.monotonic()
+
+        for name in self.queries:
+            self._prepare(name)
+
+    def _prepare(self, name):
+        try:
+            self.prepared[name] = self.session.prepare(self.queries[name])
+        except CONNECTION_ERRORS:
+            raise
+        except Exception as e:
+            # the table may not exist until the spark job has started; retried on first use
+            logging.warning(f"Could not prepare query {name}: {e}")
+
+        return self.prepared.get(name)
+
+    def get_statement(self, name):
+        return self.prepared.get(name) or self._prepare(name)
+
+    def prepare_cql(self, cql):
+        # for queries built at runtime (e.g. a column list); cached alongside the named ones
+        if cql not in self.prepared:
+            self.prepared[cql] = self.session.prepare(cql)
+        return self.prepared[cql]
+
+    def is_healthy(self):
+        if self.session is None or self.session.is_shutdown:
+            return False
+
+        if time.monotonic() - self.last_health_check < self.health_check_interval:
+            return True
+
+        try:
+            self.session.execute("SELECT release_version FROM system.local", timeout=2)
+            self.last_health_check = time.monotonic()
+            return True
+        except Exception:
+            return False
+
+    def ensure_connected(self):
+        with self.lock:
+            if self.is_healthy():
+                return self.session
+
+            self.shutdown()
+            try:
+                self.connect()
+            except Exception as e:
+                logging.warning(f"Could not connect to cassandra: {e}")
+                self.shutdown()
+                return None
+
+            return self.session
+
+    def execute(self, name, params=(), **kwargs):
+        session = self.ensure_connected()
+        if session is None:
+            raise NoHostAvailable("Cassandra is not reachable", {})
+
+        statement = self.get_statement(name)
+        if statement is None:
+            raise RuntimeError(f"Query {name} could not be prepared")
+
+        try:
+            return session.execute(statement, params, **kwargs)
+        except CONNECTION_ERRORS:
+            # force a health check (and reconnect if needed) on the next call
+            self.last_health_check = 0.0
+            raise
+
+    def shutdown(self):
+        if self.cluster is not None:
+            self.cluster.shutdown()
+        self.cluster = None
+        self.session = None
+        self.prepared = {}
+
+
+def token_ranges(splits):
+    # (start, end] ranges covering the whole ring; the partitioner never assigns MIN_TOKEN to a key
+    step = (MAX_TOKEN - MIN_TOKEN) // splits
+    bounds = [MIN_TOKEN + i * step for i in range(splits)] + [MAX_TOKEN]
+
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def count_from_counter(client, table='created_users'):
+    # one partition read of the counter maintained by the spark sink
+    row = client.execute('counter_count', (table,)).one()
+    return row.row_count if row else None
+
+
+def count_from_size_estimates(client, table='created_users'):
+    # cassandra's own per-range partition estimates; one partition per user, so partitions ~ rows
+    rows = list(client.execute('size_estimates', ('spark_streams', table)))
+    return sum(row.partitions_count for row in rows) if rows else None
+
+
+def count_exact(client, splits=64, concurrency=16):
+    # full count, but spread over token ranges so no single query has to scan the whole table
+    session = client.ensure_connected()
+    if session is None:
+        return None
+    statement = client.get_statement('range_count')
+    if statement is None:
+        return None
+
+    results = execute_concurrent_with_args(session, statement, token_ranges(splits),
+                                           concurrency=concurrency, raise_on_first_error=True)
+    return sum(result.one()[0] for _, result in results)
+
+
+COUNT_STRATEGIES = {
+    'Counter table': count_from_counter,
+    'Size estimates': count_from_size_estimates,
+    'Exact (token ranges)': count_exact,
+}
+
+
+def current_page(result):
+    # ResultSet.current_rows evaluates the page as a bool, which raises for the DataFrame pages of
+    # pandas_factory; the driver's pandas recipe reads _current_rows instead
+    page = result._current_rows
+    return pd.DataFrame() if page is None else page
+
+
+def collect_pages(result):
+    pages = [current_page(result)]
+    while result.has_more_pages:
+        result.fetch_next_page()
+        pages.append(current_page(result))
+    return pages
+
+
+def read_token_ranges(client, columns, table='created_users', limit=None, splits=16, concurrency=8,
+                      fetch_size=1000, overfetch=2):
+    # Reads the table as `splits` token ranges, `concurrency` at a time, paging each range with
+    # `fetch_size`. Every page arrives as a DataFrame (pandas_factory) and the pages are concatenated.
+    # With a `limit`, each range reads `overfetch` times its share; ranges that ran dry leave the total
+    # short, so the ranges that hit their cap are then read again for up to `limit` rows and the result
+    # is trimmed.
+    session = client.ensure_connected()
+    if session is None:
+        return optimize_user_frame(pd.DataFrame(columns=columns))
+
+    cql = f"SELECT {', '.join(columns)} FROM spark_streams.{table} WHERE token(id) > ? AND token(id) <= ?"
+    if limit is not None:
+        cql += " LIMIT ?"
+    statement = client.prepare_cql(cql)
+
+    def read_range(token_range, range_limit=None):
+        bound = statement.bind(token_range if range_limit is None else (*token_range, range_limit))
+        bound.fetch_size = fetch_size if range_limit is None else min(fetch_size, range_limit)
+
+        return [page for page in collect_pages(session.execute(bound, execution_profile=PANDAS_PROFILE))
+                if len(page)]
+
+    ranges = token_ranges(splits)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        if limit is None:
+            range_pages = list(pool.map(read_range, ranges))
+        else:
+            range_limit = math.ceil(limit / splits) * overfetch
+            range_pages = list(pool.map(read_range, ranges, [range_limit] * splits))
+            rows = [sum(len(page) for page in pages) for pages in range_pages]
+            capped = [i for i, count in enumerate(rows) if count == range_limit]
+            if sum(rows) < limit and capped and range_limit < limit:
+                # any one of the capped ranges may hold the whole shortfall
+                for i, pages in zip(capped, pool.map(read_range, [ranges[i] for i in capped],
+                                                     [limit] * len(capped))):
+                    range_pages[i] = pages
+
+    pages = [page for pages in range_pages for page in pages]
+    df = pd.concat(pages, ignore_index=True) if pages else pd.DataFrame(columns=columns)
+    if limit is not None and len(df) > limit:
+        df = df.iloc[:limit].copy()
+
+    return optimize_user_frame(df)
+
+
+def epoch_hour(ts):
+    # the driver returns timestamps as naive UTC datetimes
+    return int(ts.replace(tzinfo=datetime.timezone.utc).timestamp() // 3600)
+
+
+def utc_now():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def latest_ingest_ts(client, max_hours=24):
+    # newest ingest timestamp in recent_users_by_hour, walking back one hourly partition at a time
+    now_hour = epoch_hour(utc_now())
+    for hour in range(now_hour, now_hour - max_hours, -1):
+        row = client.execute('latest_ingest', (hour,)).one()
+        if row is not None:
+            return row.ingest_ts
+    return None
+
+
+# how far behind the watermark fetch_recent_since reads again, for rows that reach cassandra after rows
+# with a newer ingest_ts (parallel writers, retried batches)
+RECENT_OVERLAP = datetime.timedelta(seconds=30)
+
+
+def fetch_recent_since(client, watermark, seen_ids=(), overlap=RECENT_OVERLAP, max_hours=24):
+    # rows ingested after `watermark - overlap` whose id is not in `seen_ids`, reading only the hourly
+    # partitions between then and now
+    since = watermark - overlap
+    now_hour = epoch_hour(utc_now())
+    start_hour = max(epoch_hour(since), now_hour - max_hours + 1)
+
+    pages = []
+    for hour in range(start_hour, now_hour + 1):
+        result = client.execute('recent_since', (hour, since), execution_profile=PANDAS_PROFILE)
+        pages.extend(page for page in collect_pages(result) if len(page))
+
+    if not pages:
+        return pd.DataFrame()
+    df = pd.concat(pages, ignore_index=True).drop_duplicates('id')
+    df = df[~df['id'].isin(seen_ids)]
+    return optimize_user_frame(df.reset_index(drop=True))
+
+
+# must match SEARCH_BUCKET_LENGTH in spark_stream.py
+SEARCH_BUCKET_LENGTH = 2
+
+
+class SearchTermError(ValueError):
+    # the search term itself cannot be searched for, as opposed to the query failing
+    pass
+
+
+def prefix_upper_bound(prefix):
+    # smallest string greater than every string starting with `prefix`
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def search_users(client, search_field, term, mode='prefix', page_size=25, paging_state=None):
+    # One page of users matching `term` on `search_field` and the paging state of the next page (None on
+    # the last page). Prefix matches scan a single users_by_prefix partition by clustering range, exact
+    # matches go through the SAI index; neither touches the rest of the table.
+    session = client.ensure_connected()
+    if session is None:
+        raise NoHostAvailable("Cassandra is not reachable", {})
+
+    if mode == 'prefix':
+        term = term.lower()
+        if len(term) < SEARCH_BUCKET_LENGTH:
+            raise SearchTermError(f"Prefix searches need at least {SEARCH_BUCKET_LENGTH} characters")
+        name = 'search_prefix'
+        params = (search_field, term[:SEARCH_BUCKET_LENGTH], term, prefix_upper_bound(term))
+    else:
+        name = f'search_{search_field}'
+        params = (term,)
+
+    statement = client.get_statement(name)
+    if statement is None:
+        raise RuntimeError(f"Query {name} could not be prepared")
+
+    bound = statement.bind(params)
+    bound.fetch_size = page_size
+    result = session.execute(bound, paging_state=paging_state, execution_profile=PANDAS_PROFILE)
+
+    df = current_page(result)
+    if 'value' in df.columns:
+        df = df.drop(columns='value')
+    return df, result.paging_state
@@ -0,0 +1,88 @@
+import datetime
+import math
+
+import numpy as np
+import pandas as pd
+
+from cassandra_client import utc_now
+
+
+def dimension_counts(client, dimension):
+    # one partition read of the counters kept by the spark aggregates sink
+    rows = client.execute('dimension_counts', (dimension,))
+    counts = pd.Series({row.value: row.row_count for row in rows}, dtype='int64')
+    return counts[counts > 0]
+
+
+def ingest_series(client, window_minutes):
+    # records ingested per minute over the last `window_minutes`, zero-filled, one partition per day
+    end = utc_now().replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+    start = end - datetime.timedelta(minutes=window_minutes)
+
+    counts = {}
+    first_day = int(start.replace(tzinfo=datetime.timezone.utc).timestamp() // 86400)
+    last_day = int(end.replace(tzinfo=datetime.timezone.utc).timestamp() // 86400)
+    for day in range(first_day, last_day + 1):
+        for row in client.execute('ingest_minutes', (day, start, end)):
+            counts[row.minute] = row.row_count
+
+    index = pd.date_range(start, end, freq='min', inclusive='left')
+    return pd.Series(counts, dtype='int64').reindex(index, fill_value=0)
+
+
+def lttb_indices(x, y, threshold):
+    # Largest-Triangle-Three-Buckets: keeps the first and last point and, from every bucket in between,
+    # the point forming the largest triangle with the previously kept point and the next bucket's average
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    bucket_size = (n - 2) / (threshold - 2)
+
+    kept = [0]
+    a = 0
+    for i in range(threshold - 2):
+        start = int(math.floor(i * bucket_size)) + 1
+        end = int(math.floor((i + 1) * bucket_size)) + 1
+        next_start = end
+        next_end = min(int(math.floor((i + 2) * bucket_size)) + 1, n)
+        if next_start >= next_end:
+            avg_x, avg_y = x[-1], y[-1]
+        else:
+            avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+
+        areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(areas))
+        kept.append(a)
+
+    kept.append(n - 1)
+    return np.array(kept)
+
+
+def minmax_indices(y, threshold):
+    # keeps the minimum and maximum of each of threshold / 2 buckets, so spikes survive
+    n = len(y)
+    if threshold >= n or threshold < 2:
+        return np.arange(n)
+
+    y = np.asarray(y, dtype=float)
+    kept = set()
+    for bucket in np.array_split(np.arange(n), threshold // 2):
+        if len(bucket):
+            kept.add(bucket[np.argmin(y[bucket])])
+            kept.add(bucket[np.argmax(y[bucket])])
+    return np.array(sorted(kept))
+
+
+def downsample(series, max_points, method='lttb'):
+    if len(series) <= max_points:
+        return series
+
+    if method == 'minmax':
+        indices = minmax_indices(series.values, max_points)
+    else:
+        x = series.index.asi8 if isinstance(series.index, pd.DatetimeIndex) else series.index
+        indices = lttb_indices(x, series.values, max_points)
+    return series.iloc[indices]
@@ -1,69 +1,59 @@
-import uuid
+import logging
+import os
 from datetime import datetime
 from airflow import DAG
+from airflow.configuration import conf
+from airflow.models.param import Param
 from airflow.operators.python import PythonOperator
 
+# the producer lives in its own module so it can be imported (and benchmarked) without airflow
+from user_producer import stream_data, configure_logging
+from task_profiler import profile_run
+
 default_args = {
     'owner': 'airscholar',
     'start_date': datetime(2023, 9, 3, 10, 00)
 }
 
-def get_data():
-    import requests
-
-    res = requests.get("https://randomuser.me/api/")
-    res = res.json()
-    res = res['results'][0]
-
-    return res
-
-def format_data(res):
-    data = {}
-    location = res['location']
-    data['id'] = str(uuid.uuid4())
-    data['first_name'] = res['name']['first']
-    data['last_name'] = res['name']['last']
-    data['gender'] = res['gender']
-    data['address'] = f"{str(location['street']['number'])} {location['street']['name']}, " \
-                      f"{location['city']}, {location['state']}, {location['country']}"
-    data['post_code'] = location['postcode']
-    data['email'] = res['email']
-    data['username'] = res['login']['username']
-    data['dob'] = res['dob']['date']
-    data['registered_date'] = res['registered']['date']
-    data['phone'] = res['phone']
-    data['picture'] = res['picture']['medium']
-
-    return data
-
-def stream_data():
-    import json
-    from kafka import KafkaProducer
-    import time
-    import logging
-
-    producer = KafkaProducer(bootstrap_servers=['broker:29092'], max_block_ms=5000)
-    curr_time = time.time()
-
-    while True:
-        if time.time() > curr_time + 300: #1 minute
-            break
-        try:
-            res = get_data()
-            res = format_data(res)
+# trigger with e.g. {"profile": true} to profile one run; off for scheduled runs
+params = {
+    'profile': Param(False, type='boolean', description="Profile stream_data and write the profiles to the task's log directory"),
+    'profile_sample_ms': Param(10, type='integer', minimum=1, description="Stack sampling interval for the collapsed stacks"),
+    'profile_cprofile': Param(True, type='boolean', description="Also run cProfile (exact call counts, slows every call)"),
+    'profile_memory': Param(True, type='boolean', description="Take tracemalloc snapshots"),
+}
 
-            producer.send('users_data', json.dumps(res).encode('utf-8'))
-            print("Record Inserted !!")
-        except Exception as e:
-            logging.error(f'An error occured: {e}')
-            continue
+def task_log_dir(ti):
+    # same layout as the default log_filename_template, so the profiles and events sit next to the attempt's log
+    return os.path.join(conf.get('logging', 'base_log_folder'), f"dag_id={ti.dag_id}", f"run_id={ti.run_id}",
+                        f"task_id={ti.task_id}")
+
+def stream_data_task(params, ti, **_):
+    # the producer's events as JSON lines in their own file
+    os.makedirs(task_log_dir(ti), exist_ok=True)
+    events_path = os.path.join(task_log_dir(ti), f"events_attempt={ti.try_number}.jsonl")
+    handler = configure_logging(events_path)
+    logging.info(f"Producer events are written to {events_path}")
+
+    try:
+        if not params.get('profile'):
+            stream_data()
+            return
+
+        with profile_run(os.path.join(task_log_dir(ti), f"profile_attempt={ti.try_number}"),
+                         sample_interval=params['profile_sample_ms'] / 1000,
+                         memory=params['profile_memory'], deterministic=params['profile_cprofile']):
+            stream_data()
+    finally:
+        handler.close()
 
 with DAG('user_automation',
          default_args=default_args,
          schedule_interval='@daily',
-         catchup=False) as dag:
+         catchup=False,
+         params=params) as dag:
 
     streaming_task = PythonOperator(
         task_id='stream_data_from_api',
-        python_callable=stream_data
-    )
\ No newline at end of file
+        python_callable=stream_data_task
+    )
@@ -0,0 +1,81 @@
+import json
+import logging
+import threading
+import time
+
+# Log formatting shared by the producer DAG and the spark job. It lives in dags/ because that is the only
+# directory airflow mounts; spark_stream.py imports it from there (or from next to itself when both are
+# copied into a container) and ships it to the executors.
+
+
+class JsonFormatter(logging.Formatter):
+    # one JSON object per line; structured fields come from extra={'fields': {...}} (see log_event)
+
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+
+    def format(self, record):
+        line = super().format(record)
+        extra_fields = getattr(record, 'fields', {})
+        return line + ''.join(f" {key}={value}" for key, value in extra_fields.items())
+
+
+class RateLimitFilter(logging.Filter):
+    # Passes at most `burst` WARNING+ records per message every `period` seconds, so a failing dependency
+    # logs a few lines per period instead of one per record. The next record let through carries the
+    # number suppressed in between. Messages are constant strings with the details in fields, so the
+    # message works as the key.
+
+    def __init__(self, burst=5, period=60.0):
+        super().__init__()
+        self.burst = burst
+        self.period = period
+        self.windows = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            return True
+
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self.lock:
+            window_start, passed, suppressed = self.windows.get(key, (now, 0, 0))
+            if now - window_start >= self.period:
+                window_start, passed = now, 0
+            if passed >= self.burst:
+                self.windows[key] = (window_start, passed, suppressed + 1)
+                return False
+            self.windows[key] = (window_start, passed + 1, 0)
+
+        if suppressed:
+            record.fields = dict(getattr(record, 'fields', {}), suppressed=suppressed)
+        return True
+
+
+def configure_logger(logger, level='INFO', log_format='json', handler=None, rate_limit=None):
+    # gives `logger` a single handler (stderr by default) with the formatter and the rate limit, and stops
+    # propagation so its lines are not written again in another handler's format
+    handler = handler or logging.StreamHandler()
+    if log_format == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(TextFormatter('%(asctime)s %(levelname)s %(name)s %(message)s'))
+    handler.addFilter(rate_limit or RateLimitFilter())
+
+    logger.handlers[:] = [handler]
+    logger.setLevel(level)
+    logger.propagate = False
+    return handler
@@ -0,0 +1,104 @@
+import collections
+import contextlib
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+
+class StackSampler(threading.Thread):
+    # Samples the stack of one thread every `interval` seconds and counts identical stacks, which is
+    # the "collapsed" format flamegraph.pl, speedscope and inferno read (one "frame;frame;frame count"
+    # line per stack, root first). The sampler needs the GIL to look, so samples lean towards places where
+    # the profiled thread releases it (network and file I/O); for CPU-bound detail use the cProfile output.
+
+    def __init__(self, thread_id, interval=0.01):
+        super().__init__(name='stack-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+    def write_collapsed(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def write_cprofile(profiler, output_dir, name, top=50):
+    profiler.dump_stats(os.path.join(output_dir, f'{name}.prof'))
+
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(top)
+    with open(os.path.join(output_dir, f'{name}_cumulative.txt'), 'w') as f:
+        f.write(summary.getvalue())
+
+
+def write_tracemalloc(first, last, output_dir, name, top=30):
+    last.dump(os.path.join(output_dir, f'{name}.tracemalloc'))
+
+    with open(os.path.join(output_dir, f'{name}_memory.txt'), 'w') as f:
+        f.write(f"Top {top} allocation sites at the end of the run\n")
+        for stat in last.statistics('lineno')[:top]:
+            f.write(f"{stat}\n")
+        f.write(f"\nTop {top} changes since the start of the run\n")
+        for stat in last.compare_to(first, 'lineno')[:top]:
+            f.write(f"{stat}\n")
+
+
+@contextlib.contextmanager
+def profile_run(output_dir, name='stream_data', sample_interval=0.01, memory=True, deterministic=True):
+    # Profiles the body of the `with` block and writes to `output_dir`:
+    #   <name>.collapsed            sampled stacks of the calling thread, flame-graph ready
+    #   <name>.prof, _cumulative.txt cProfile stats (if deterministic; adds per-call overhead)
+    #   <name>.tracemalloc, _memory.txt tracemalloc snapshot, top allocation sites and growth (if memory)
+    os.makedirs(output_dir, exist_ok=True)
+
+    sampler = StackSampler(threading.get_ident(), sample_interval)
+    profiler = cProfile.Profile() if deterministic else None
+    first_snapshot = None
+    if memory:
+        tracemalloc.start(10)
+        first_snapshot = tracemalloc.take_snapshot()
+
+    started = time.perf_counter()
+    sampler.start()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        sampler.stop()
+        elapsed = time.perf_counter() - started
+
+        sampler.write_collapsed(os.path.join(output_dir, f'{name}.collapsed'))
+        if profiler is not None:
+            write_cprofile(profiler, output_dir, name)
+        if memory:
+            write_tracemalloc(first_snapshot, tracemalloc.take_snapshot(), output_dir, name)
+            tracemalloc.stop()
+
+        logging.info(f"Profiled {name} for {elapsed:.1f}s ({sum(sampler.stacks.values())} stack samples), "
+                     f"profiles written to {output_dir}")
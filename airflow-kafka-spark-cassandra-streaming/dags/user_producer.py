@@ -0,0 +1,95 @@
+import json
+import logging
+import random
+import time
+import uuid
+
+from structured_logging import RateLimitFilter, configure_logger
+
+logger = logging.getLogger('user_producer')
+
+SUMMARY_INTERVAL = 10
+# share of sent records logged at DEBUG
+RECORD_LOG_SAMPLE_RATE = 0.01
+
+def get_data():
+    import requests
+
+    res = requests.get("https://randomuser.me/api/")
+    res = res.json()
+    res = res['results'][0]
+
+    return res
+
+def format_data(res, fetch_started_at=None, fetched_at=None):
+    data = {}
+    location = res['location']
+    data['id'] = str(uuid.uuid4())
+    data['first_name'] = res['name']['first']
+    data['last_name'] = res['name']['last']
+    data['gender'] = res['gender']
+    data['address'] = f"{str(location['street']['number'])} {location['street']['name']}, " \
+                      f"{location['city']}, {location['state']}, {location['country']}"
+    data['post_code'] = location['postcode']
+    data['email'] = res['email']
+    data['username'] = res['login']['username']
+    data['dob'] = res['dob']['date']
+    data['registered_date'] = res['registered']['date']
+    data['phone'] = res['phone']
+    data['picture'] = res['picture']['medium']
+
+    # latency trace (epoch ms): the spark job adds its own stamps and the latency_traces sink stores them
+    data['trace_id'] = str(uuid.uuid4())
+    data['fetch_started_at'] = fetch_started_at
+    data['fetched_at'] = fetched_at
+    data['produced_at'] = int(time.time() * 1000)
+
+    return data
+
+def configure_logging(path=None, level='INFO'):
+    # JSON lines to `path` (airflow would wrap lines sent through its task log in its own format) or stderr;
+    # at most 5 lines per error message every SUMMARY_INTERVAL, the rest are counted in the next one
+    handler = logging.FileHandler(path) if path else None
+    return configure_logger(logger, level, handler=handler, rate_limit=RateLimitFilter(5, SUMMARY_INTERVAL))
+
+def log_event(level, message, **fields):
+    if logger.isEnabledFor(level):
+        logger.log(level, message, extra={'fields': fields})
+
+def stream_data():
+    from kafka import KafkaProducer
+
+    producer = KafkaProducer(bootstrap_servers=['broker:29092'], max_block_ms=5000)
+    curr_time = time.time()
+
+    # progress is one summary line every SUMMARY_INTERVAL seconds instead of a line per record
+    sent = errors = 0
+    window_start, window_sent = curr_time, 0
+
+    while True:
+        now = time.time()
+        if now > curr_time + 300: #5 minutes
+            break
+        if now - window_start >= SUMMARY_INTERVAL:
+            log_event(logging.INFO, "Producer progress", sent=sent, errors=errors,
+                      records_per_second=round(window_sent / (now - window_start), 1))
+            window_start, window_sent = now, 0
+
+        try:
+            fetch_started_at = int(time.time() * 1000)
+            res = get_data()
+            res = format_data(res, fetch_started_at, int(time.time() * 1000))
+
+            producer.send('users_data', json.dumps(res).encode('utf-8'))
+            sent += 1
+            window_sent += 1
+            if logger.isEnabledFor(logging.DEBUG) and random.random() < RECORD_LOG_SAMPLE_RATE:
+                log_event(logging.DEBUG, "Record sent", trace_id=res['trace_id'], sample_rate=RECORD_LOG_SAMPLE_RATE)
+        except Exception as e:
+            errors += 1
+            # an unreachable API or broker fails every record; the rate limit keeps a few lines per window
+            log_event(logging.ERROR, "Could not produce record", error=repr(e), errors=errors)
+            continue
+
+    producer.flush()
+    log_event(logging.INFO, "Producer finished", sent=sent, errors=errors, seconds=round(time.time() - curr_time, 1))
@@ -0,0 +1,244 @@
+import argparse
+import atexit
+import datetime
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+from cassandra import ConsistencyLevel
+from cassandra.cluster import Cluster, ExecutionProfile, EXEC_PROFILE_DEFAULT
+
+from cassandra_client import token_ranges, pandas_factory, current_page
+
+# Exports a spark_streams table to chunked, compressed files plus a manifest.json. The token ring is cut
+# into --splits ranges and --workers processes read them in parallel, each paging its range and writing a
+# part file every --rows-per-file rows, so the export is bound by the disk and cassandra rather than one
+# paged query. A range's files are written under a .tmp name and renamed when the range is complete, and
+# the manifest is rewritten after every range; rerunning the same command skips the ranges it lists.
+# Rows written while the export runs may or may not be included; for a point-in-time copy, stop the
+# writers (or take a `nodetool snapshot`) first.
+
+KEYSPACE = 'spark_streams'
+FORMATS = {
+    # format: (file extension, default compression)
+    'parquet': ('.parquet', 'zstd'),
+    'csv': ('.csv', 'gzip'),
+    'jsonl': ('.jsonl', 'gzip'),
+}
+MANIFEST = 'manifest.json'
+# manifest keys that must match for a rerun to resume instead of starting over
+RESUME_KEYS = ['table', 'format', 'compression', 'splits', 'columns']
+
+_session = None
+_statement = None
+_options = None
+
+
+def file_name(range_index, part, file_format, compression):
+    extension = FORMATS[file_format][0]
+    if file_format != 'parquet' and compression == 'gzip':
+        extension += '.gz'
+    return f'range-{range_index:05d}-part-{part:04d}{extension}'
+
+
+def write_frame(df, path, file_format, compression):
+    if file_format == 'parquet':
+        # needs pyarrow
+        df.to_parquet(path, index=False, compression=compression)
+    elif file_format == 'csv':
+        df.to_csv(path, index=False, compression=compression)
+    else:
+        df.to_json(path, orient='records', lines=True, compression=compression)
+
+
+def init_reader(hosts, cql, consistency, options):
+    # once per worker process: its own cluster connection, pages returned as DataFrames
+    global _session, _statement, _options
+
+    cluster = Cluster(hosts, execution_profiles={
+        EXEC_PROFILE_DEFAULT: ExecutionProfile(row_factory=pandas_factory,
+                                               consistency_level=ConsistencyLevel.name_to_value[consistency]),
+    })
+    _session = cluster.connect()
+    atexit.register(cluster.shutdown)
+    _statement = _session.prepare(cql)
+    _options = options
+
+
+def export_range(range_index, token_range):
+    bound = _statement.bind(token_range)
+    bound.fetch_size = _options['fetch_size']
+    result = _session.execute(bound)
+
+    files = []
+    pages = []
+    buffered = 0
+
+    def flush():
+        nonlocal pages, buffered
+        name = file_name(range_index, len(files), _options['format'], _options['compression'])
+        path = os.path.join(_options['output_dir'], name)
+        write_frame(pd.concat(pages, ignore_index=True), path + '.tmp', _options['format'], _options['compression'])
+        files.append({'path': name, 'rows': buffered})
+        pages, buffered = [], 0
+
+    while True:
+        page = current_page(result)
+        if len(page):
+            pages.append(page)
+            buffered += len(page)
+            if buffered >= _options['rows_per_file']:
+                flush()
+        if not result.has_more_pages:
+            break
+        result.fetch_next_page()
+    if pages:
+        flush()
+
+    # the range only counts as exported once all its files are in place
+    for entry in files:
+        path = os.path.join(_options['output_dir'], entry['path'])
+        os.replace(path + '.tmp', path)
+        entry['bytes'] = os.path.getsize(path)
+
+    return range_index, {'token_range': list(token_range), 'rows': sum(f['rows'] for f in files), 'files': files}
+
+
+def write_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, MANIFEST)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def load_manifest(output_dir, expected, restart):
+    path = os.path.join(output_dir, MANIFEST)
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as f:
+        manifest = json.load(f)
+    if restart:
+        for entry in manifest['ranges'].values():
+            for part in entry['files']:
+                os.remove(os.path.join(output_dir, part['path']))
+        os.remove(path)
+        return None
+
+    mismatched = [key for key in RESUME_KEYS if manifest.get(key) != expected[key]]
+    if mismatched:
+        raise SystemExit(f"{path} was written with different {mismatched}; pass --restart to start over")
+    return manifest
+
+
+def table_columns(cluster, table):
+    metadata = cluster.metadata.keyspaces.get(KEYSPACE)
+    if metadata is None or table not in metadata.tables:
+        raise SystemExit(f"{KEYSPACE}.{table} does not exist")
+    table_metadata = metadata.tables[table]
+    return list(table_metadata.columns), [column.name for column in table_metadata.partition_key]
+
+
+def export(args):
+    os.makedirs(args.output_dir, exist_ok=True)
+    compression = args.compression or FORMATS[args.format][1]
+    if compression == 'none':
+        compression = None
+
+    cluster = Cluster(args.cassandra_hosts)
+    try:
+        cluster.connect()
+        all_columns, partition_key = table_columns(cluster, args.table)
+    finally:
+        cluster.shutdown()
+    columns = args.columns or all_columns
+
+    expected = {'table': f'{KEYSPACE}.{args.table}', 'format': args.format, 'compression': compression,
+                'splits': args.splits, 'columns': columns}
+    manifest = load_manifest(args.output_dir, expected, args.restart) or {
+        **expected,
+        'started_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'finished_at': None,
+        'rows': 0,
+        'ranges': {},
+    }
+    # leftovers of ranges that were being written when a previous run stopped
+    listed = {part['path'] for entry in manifest['ranges'].values() for part in entry['files']}
+    for path in glob.glob(os.path.join(args.output_dir, 'range-*')):
+        if os.path.basename(path) not in listed:
+            os.remove(path)
+
+    key = ', '.join(partition_key)
+    cql = f"SELECT {', '.join(columns)} FROM {KEYSPACE}.{args.table} WHERE token({key}) > ? AND token({key}) <= ?"
+    options = {'fetch_size': args.fetch_size, 'rows_per_file': args.rows_per_file, 'format': args.format,
+               'compression': compression, 'output_dir': args.output_dir}
+    remaining = [(i, token_range) for i, token_range in enumerate(token_ranges(args.splits))
+                 if str(i) not in manifest['ranges']]
+    if len(remaining) < args.splits:
+        logging.info(f"Resuming: {args.splits - len(remaining)} of {args.splits} ranges already exported")
+
+    started = time.perf_counter()
+    exported_rows = 0
+    # spawn: each worker builds its own cassandra connection
+    with ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=init_reader,
+                             initargs=(args.cassandra_hosts, cql, args.consistency, options)) as pool:
+        futures = [pool.submit(export_range, i, token_range) for i, token_range in remaining]
+        for done, future in enumerate(as_completed(futures), 1):
+            range_index, entry = future.result()
+            manifest['ranges'][str(range_index)] = entry
+            manifest['rows'] += entry['rows']
+            exported_rows += entry['rows']
+            write_manifest(args.output_dir, manifest)
+            if done % max(1, len(futures) // 20) == 0:
+                elapsed = time.perf_counter() - started
+                logging.info(f"{done}/{len(futures)} ranges, {exported_rows} rows, {exported_rows / elapsed:.0f} rows/s")
+
+    elapsed = time.perf_counter() - started
+    manifest['finished_at'] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    write_manifest(args.output_dir, manifest)
+
+    files = [part for entry in manifest['ranges'].values() for part in entry['files']]
+    return {
+        'table': manifest['table'],
+        'output_dir': args.output_dir,
+        'rows': manifest['rows'],
+        'files': len(files),
+        'bytes': sum(part['bytes'] for part in files),
+        'exported_rows': exported_rows,
+        'seconds': round(elapsed, 2),
+        'rows_per_second': round(exported_rows / elapsed) if elapsed else None,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=f"Export a {KEYSPACE} table to chunked files with a manifest")
+    parser.add_argument('--cassandra-hosts', nargs='+', default=['localhost'])
+    parser.add_argument('--table', default='created_users')
+    parser.add_argument('--columns', nargs='+', help="default: every column of the table")
+    parser.add_argument('--output-dir', default='export/created_users')
+    parser.add_argument('--format', choices=sorted(FORMATS), default='parquet')
+    parser.add_argument('--compression', help="parquet: zstd (default), snappy, gzip or none; "
+                                              "csv / jsonl: gzip (default) or none")
+    parser.add_argument('--splits', type=int, default=256, help="token ranges the ring is cut into")
+    parser.add_argument('--workers', type=int, default=max(1, min(8, os.cpu_count() or 1)),
+                        help="reader processes")
+    parser.add_argument('--fetch-size', type=int, default=5000, help="rows per page")
+    parser.add_argument('--rows-per-file', type=int, default=500000)
+    parser.add_argument('--consistency', default='LOCAL_ONE', choices=sorted(ConsistencyLevel.name_to_value))
+    parser.add_argument('--restart', action='store_true', help="discard a previous, incomplete export")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    print(json.dumps(export(parse_args(argv)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+import collections
+import json
+import logging
+import threading
+import time
+
+
+class LiveUserFeed:
+    # Tails the users topic in a background thread and keeps rolling in-memory aggregates: the most
+    # recent users, per-second arrival counts and gender / email domain counts. Readers only take
+    # snapshots, so the dashboard can refresh as often as it likes without touching Cassandra.
+
+    def __init__(self, bootstrap_servers, topic='users_data', buffer_size=500, rate_window_seconds=60):
+        self.bootstrap_servers = bootstrap_servers
+        self.topic = topic
+        self.rate_window_seconds = rate_window_seconds
+
+        self.recent = collections.deque(maxlen=buffer_size)
+        self.per_second = collections.OrderedDict()
+        self.gender_counts = collections.Counter()
+        self.domain_counts = collections.Counter()
+        self.total = 0
+        self.invalid = 0
+        self.last_message_at = None
+        self.error = None
+
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, name=f'live-feed-{self.topic}', daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+
+    def _run(self):
+        backoff = 1
+        while not self.stop_event.is_set():
+            consumer = None
+            try:
+                # imported here so a missing or broken kafka-python is reported like a connection error
+                from kafka import KafkaConsumer
+
+                # no group id: every dashboard process tails the topic on its own without committing offsets
+                consumer = KafkaConsumer(
+                    self.topic,
+                    bootstrap_servers=self.bootstrap_servers,
+                    auto_offset_reset='latest',
+                    enable_auto_commit=False,
+                    group_id=None,
+                )
+                self.error = None
+                backoff = 1
+
+                while not self.stop_event.is_set():
+                    batches = consumer.poll(timeout_ms=500)
+                    for records in batches.values():
+                        for record in records:
+                            self._add(record.value, record.timestamp)
+            except Exception as e:
+                self.error = str(e)
+                logging.warning(f"Live feed consumer failed, retrying in {backoff}s: {e}")
+                self.stop_event.wait(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                if consumer is not None:
+                    consumer.close()
+
+    def _add(self, value, timestamp_ms):
+        try:
+            user = json.loads(value)
+        except (TypeError, ValueError):
+            user = None
+        # valid JSON that is not an object (a string, list or number) counts as invalid too
+        if not isinstance(user, dict):
+            with self.lock:
+                self.invalid += 1
+            return
+
+        email = user.get('email') or ''
+        second = int(timestamp_ms // 1000) if timestamp_ms else int(time.time())
+
+        with self.lock:
+            self.recent.appendleft({
+                'username': user.get('username'),
+                'first_name': user.get('first_name'),
+                'gender': user.get('gender'),
+                'email': email,
+                'registered_date': user.get('registered_date'),
+            })
+            self.gender_counts[user.get('gender') or 'Unknown'] += 1
+            self.domain_counts[email.split('@')[-1] if '@' in email else 'Unknown'] += 1
+            self.per_second[second] = self.per_second.get(second, 0) + 1
+            self.total += 1
+            self.last_message_at = time.time()
+
+            oldest_kept = second - self.rate_window_seconds
+            while self.per_second and next(iter(self.per_second)) < oldest_kept:
+                self.per_second.popitem(last=False)
+
+    def snapshot(self):
+        now = int(time.time())
+        with self.lock:
+            per_second = [(ts, count) for ts, count in self.per_second.items()
+                          if ts > now - self.rate_window_seconds]
+            window_total = sum(count for _, count in per_second)
+
+            return {
+                'recent': list(self.recent),
+                'per_second': per_second,
+                'rate': window_total / self.rate_window_seconds,
+                'gender_counts': dict(self.gender_counts),
+                'domain_counts': dict(self.domain_counts),
+                'total': self.total,
+                'invalid': self.invalid,
+                'last_message_at': self.last_message_at,
+                'error': self.error,
+                'running': self.thread is not None and self.thread.is_alive(),
+            }
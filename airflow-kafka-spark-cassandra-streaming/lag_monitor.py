@@ -0,0 +1,261 @@
+import argparse
+import collections
+import glob
+import json
+import logging
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# How far the spark query is behind its topics. Structured streaming does not commit offsets to a Kafka
+# consumer group; the offsets it has finished are in the checkpoint: offsets/<batch> holds the end offsets
+# planned for a batch and commits/<batch> appears once that batch is written. The monitor compares the
+# newest committed batch with the topics' end offsets, tracks produce / consume rates over a sliding window
+# and recommends a worker count and maxOffsetsPerTrigger when the query is falling behind.
+#
+# Run it as a sidecar where the checkpoint is readable (e.g. inside the spark-master container), or call
+# lag_below() from an Airflow PythonSensor. Only the Kafka protocol is used, so any Kafka-compatible broker
+# (e.g. a single redpanda container) works as a local stand-in.
+
+
+def latest_batch(directory):
+    batches = [int(os.path.basename(path)) for path in glob.glob(os.path.join(directory, '*'))
+               if os.path.basename(path).isdigit()]
+    return max(batches) if batches else None
+
+
+def read_checkpoint_offsets(checkpoint_location):
+    # {topic: {partition: offset}} of the newest committed batch, and that batch's id
+    batch_id = latest_batch(os.path.join(checkpoint_location, 'commits'))
+    if batch_id is None:
+        return {}, None
+
+    with open(os.path.join(checkpoint_location, 'offsets', str(batch_id))) as f:
+        # "v1", the batch metadata, then one JSON line per source
+        lines = f.read().splitlines()[2:]
+
+    offsets = {}
+    for line in lines:
+        if not line.startswith('{'):
+            continue
+        for topic, partitions in json.loads(line).items():
+            offsets.setdefault(topic, {}).update({int(p): offset for p, offset in partitions.items()})
+    return offsets, batch_id
+
+
+class KafkaEndOffsets:
+
+    def __init__(self, bootstrap_servers):
+        from kafka import KafkaConsumer
+
+        self.consumer = KafkaConsumer(bootstrap_servers=bootstrap_servers, group_id=None, enable_auto_commit=False)
+
+    def end_offsets(self, topics):
+        from kafka import TopicPartition
+
+        partitions = [TopicPartition(topic, p) for topic in topics
+                      for p in sorted(self.consumer.partitions_for_topic(topic) or [])]
+        return {(tp.topic, tp.partition): offset for tp, offset in self.consumer.end_offsets(partitions).items()}
+
+    def close(self):
+        self.consumer.close()
+
+
+class LagTracker:
+    # keeps (time, produced, consumed) totals over `window_seconds` to derive rates
+
+    def __init__(self, window_seconds=300):
+        self.window_seconds = window_seconds
+        self.samples = collections.deque()
+
+    def add(self, now, produced, consumed):
+        self.samples.append((now, produced, consumed))
+        while len(self.samples) > 2 and now - self.samples[0][0] > self.window_seconds:
+            self.samples.popleft()
+
+    def rates(self):
+        if len(self.samples) < 2:
+            return None, None
+        (t0, produced0, consumed0), (t1, produced1, consumed1) = self.samples[0], self.samples[-1]
+        if t1 <= t0:
+            return None, None
+        return (produced1 - produced0) / (t1 - t0), (consumed1 - consumed0) / (t1 - t0)
+
+
+def recommend(lag, produce_rate, consume_rate, workers, trigger_seconds, max_offsets_per_trigger,
+              target_catch_up_seconds, headroom=0.2):
+    # Scale so the query drains the current lag within target_catch_up_seconds while keeping up with
+    # producers, plus headroom. Assumes throughput grows roughly linearly with workers, which holds until
+    # the topic's partition count or cassandra becomes the limit.
+    if produce_rate is None or consume_rate is None:
+        return {'action': 'wait', 'reason': 'not enough samples yet'}
+
+    needed_rate = (produce_rate + lag / target_catch_up_seconds) * (1 + headroom)
+    # a query with no lag only consumes as fast as records arrive, so its observed rate is a lower bound
+    per_worker = consume_rate / workers if consume_rate > 0 and workers else None
+
+    recommendation = {
+        'needed_records_per_second': round(needed_rate, 1),
+        'max_offsets_per_trigger': max(1, math.ceil(needed_rate * trigger_seconds)) if trigger_seconds else None,
+    }
+
+    if per_worker is None:
+        recommendation.update(action='investigate', reason='the query consumed nothing in the window')
+        return recommendation
+
+    wanted_workers = max(1, math.ceil(needed_rate / per_worker))
+    if lag > 0 and (consume_rate < produce_rate or wanted_workers > workers):
+        recommendation.update(action='scale_out', workers=wanted_workers,
+                              reason='lag is growing' if consume_rate < produce_rate
+                              else f'lag will not drain within {target_catch_up_seconds}s')
+    elif lag == 0 and workers > 1 and produce_rate * (1 + headroom) < per_worker * (workers - 1):
+        recommendation.update(action='scale_in', workers=workers - 1, reason='one worker fewer still keeps up')
+    else:
+        recommendation.update(action='none', workers=workers)
+
+    if max_offsets_per_trigger and recommendation['max_offsets_per_trigger'] <= max_offsets_per_trigger:
+        # the current cap is already large enough
+        recommendation['max_offsets_per_trigger'] = max_offsets_per_trigger
+    return recommendation
+
+
+def measure(offset_source, checkpoint_location, topics):
+    committed, batch_id = read_checkpoint_offsets(checkpoint_location)
+    end_offsets = offset_source.end_offsets(topics)
+
+    partitions = []
+    for (topic, partition), end in sorted(end_offsets.items()):
+        done = committed.get(topic, {}).get(partition)
+        partitions.append({
+            'topic': topic,
+            'partition': partition,
+            'end_offset': end,
+            'committed_offset': done,
+            # a partition the query has not reached yet counts as entirely behind
+            'lag': end - (done if done is not None else 0),
+        })
+
+    return {
+        'batch_id': batch_id,
+        'partitions': partitions,
+        'lag': sum(p['lag'] for p in partitions),
+        'produced': sum(p['end_offset'] for p in partitions),
+        'consumed': sum(p['committed_offset'] or 0 for p in partitions),
+    }
+
+
+def check(offset_source, tracker, args):
+    now = time.time()
+    snapshot = measure(offset_source, args.checkpoint_location, args.topics)
+    tracker.add(now, snapshot['produced'], snapshot['consumed'])
+    produce_rate, consume_rate = tracker.rates()
+
+    catch_up = None
+    if consume_rate is not None and consume_rate > produce_rate:
+        catch_up = round(snapshot['lag'] / (consume_rate - produce_rate), 1)
+
+    return {
+        'ts': now,
+        'batch_id': snapshot['batch_id'],
+        'lag': snapshot['lag'],
+        'partitions': snapshot['partitions'],
+        'produce_rate': round(produce_rate, 2) if produce_rate is not None else None,
+        'consume_rate': round(consume_rate, 2) if consume_rate is not None else None,
+        # None: not catching up at the current rates
+        'catch_up_seconds': 0 if snapshot['lag'] == 0 else catch_up,
+        'recommendation': recommend(snapshot['lag'], produce_rate, consume_rate, args.workers,
+                                    args.trigger_seconds, args.max_offsets_per_trigger,
+                                    args.target_catch_up_seconds),
+    }
+
+
+def prometheus_metrics(result):
+    lines = [
+        '# TYPE spark_stream_lag_records gauge',
+        *(f'spark_stream_lag_records{{topic="{p["topic"]}",partition="{p["partition"]}"}} {p["lag"]}'
+          for p in result['partitions']),
+        '# TYPE spark_stream_lag_total gauge',
+        f'spark_stream_lag_total {result["lag"]}',
+    ]
+    for name in ('produce_rate', 'consume_rate', 'catch_up_seconds'):
+        if result[name] is not None:
+            lines += [f'# TYPE spark_stream_{name} gauge', f'spark_stream_{name} {result[name]}']
+    if result['recommendation'].get('workers'):
+        lines += ['# TYPE spark_stream_recommended_workers gauge',
+                  f'spark_stream_recommended_workers {result["recommendation"]["workers"]}']
+    return '\n'.join(lines) + '\n'
+
+
+def serve_metrics(port, latest):
+    class MetricsHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            result = latest.get('result')
+            body = prometheus_metrics(result).encode('utf-8') if result else b''
+            self.send_response(200 if result else 503)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='lag-metrics', daemon=True).start()
+    return server
+
+
+def lag_below(bootstrap_servers, checkpoint_location, topics, max_lag):
+    # for an Airflow PythonSensor: true once the query is less than `max_lag` records behind
+    source = KafkaEndOffsets(bootstrap_servers)
+    try:
+        return measure(source, checkpoint_location, topics)['lag'] < max_lag
+    finally:
+        source.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Kafka lag of the spark streaming query, with a scaling recommendation")
+    parser.add_argument('--bootstrap-servers', default='localhost:9092')
+    parser.add_argument('--topics', nargs='+', default=['users_data'])
+    parser.add_argument('--checkpoint-location', default='/tmp/checkpoint')
+    parser.add_argument('--interval', type=float, default=15, help="seconds between checks")
+    parser.add_argument('--window', type=float, default=300, help="seconds of history used for rates")
+    parser.add_argument('--workers', type=int, default=1, help="spark workers running the query now")
+    parser.add_argument('--trigger-seconds', type=float, default=None, help="the query's trigger interval")
+    parser.add_argument('--max-offsets-per-trigger', type=int, default=None, help="the query's current cap")
+    parser.add_argument('--target-catch-up-seconds', type=float, default=300)
+    parser.add_argument('--prometheus-port', type=int, help="serve the latest result as Prometheus metrics")
+    parser.add_argument('--once', action='store_true', help="print one result and exit")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    source = KafkaEndOffsets(args.bootstrap_servers)
+    tracker = LagTracker(args.window)
+    latest = {}
+    if args.prometheus_port:
+        serve_metrics(args.prometheus_port, latest)
+
+    try:
+        while True:
+            try:
+                latest['result'] = check(source, tracker, args)
+                # one JSON line per check, for log shippers or `jq`
+                print(json.dumps(latest['result']), flush=True)
+            except Exception as e:
+                logging.warning(f"Lag check failed: {e}")
+            if args.once:
+                break
+            time.sleep(args.interval)
+    finally:
+        source.close()
+
+
+if __name__ == '__main__':
+    main()
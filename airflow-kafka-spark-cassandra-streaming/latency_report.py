@@ -0,0 +1,95 @@
+import argparse
+import json
+
+import pandas as pd
+from cassandra.cluster import Cluster
+
+# Breaks the time from API call to Cassandra write into stages, using the stamps collected by the
+# latency_traces sink. All stamps come from containers on the same host, so their clocks agree; across
+# hosts, clock skew shows up in the stage that crosses machines.
+
+STAGES = [
+    # stage, from stamp, to stamp
+    # the randomuser API request
+    ('api', 'fetch_started_at', 'fetched_at'),
+    # format_data and json serialization in the producer
+    ('format', 'fetched_at', 'produced_at'),
+    # kafka-python's send buffer and the request to the broker; with LogAppendTime (see docker-compose.yml)
+    # kafka_ts is when the broker appended the record
+    ('producer_queue', 'produced_at', 'kafka_ts'),
+    # appended until the batch holding the record starts: mostly waiting for the next trigger (or for the
+    # previous batch to finish), not time spent in the broker
+    ('trigger_wait', 'kafka_ts', 'batch_started_at'),
+    # the batch's kafka read, from_json parse, validation and counts (batch_processed_at is stamped once the
+    # batch is parsed, before any sink runs)
+    ('spark_parse', 'batch_started_at', 'batch_processed_at'),
+    # every sink listed before latency_traces, then the trace row's own write (written_at is its WRITETIME)
+    ('sinks', 'batch_processed_at', 'written_at'),
+]
+
+TRACE_QUERY = "SELECT trace_id, batch_id, fetch_started_at, fetched_at, produced_at, kafka_ts, batch_started_at, " \
+              "batch_processed_at, WRITETIME(batch_processed_at) AS written_us FROM spark_streams.pipeline_traces"
+
+
+def load_traces(session, limit):
+    rows = session.execute(f"{TRACE_QUERY} LIMIT {int(limit)}")
+    traces = pd.DataFrame(list(rows))
+    if traces.empty:
+        return traces
+
+    traces['written_at'] = traces['written_us'] // 1000
+    return traces
+
+
+def latency_breakdown(traces, percentiles=(50, 95, 99)):
+    stages = {}
+    for stage, start, end in STAGES + [('total', 'fetch_started_at', 'written_at')]:
+        durations = (traces[end] - traces[start]).dropna()
+        if durations.empty:
+            continue
+        stages[stage] = {
+            'records': int(len(durations)),
+            'mean_ms': round(float(durations.mean()), 1),
+            **{f'p{p}_ms': float(durations.quantile(p / 100)) for p in percentiles},
+        }
+
+    total = stages.get('total', {}).get('mean_ms')
+    for stage, stats in stages.items():
+        if total and stage != 'total':
+            stats['share_of_total'] = round(stats['mean_ms'] / total, 3)
+    return stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage latency report from spark_streams.pipeline_traces")
+    parser.add_argument('--cassandra-host', default='localhost')
+    parser.add_argument('--limit', type=int, default=100000, help="traces to read")
+    parser.add_argument('--json', action='store_true', help="print the breakdown as JSON")
+    args = parser.parse_args()
+
+    cluster = Cluster([args.cassandra_host])
+    try:
+        traces = load_traces(cluster.connect(), args.limit)
+    finally:
+        cluster.shutdown()
+
+    if traces.empty:
+        print("No traces yet: add latency_traces to the spark job's sinks and run the DAG.")
+        return
+
+    stages = latency_breakdown(traces)
+    if args.json:
+        print(json.dumps({'traces': len(traces), 'batches': int(traces['batch_id'].nunique()), 'stages': stages},
+                         indent=2))
+        return
+
+    print(f"{len(traces)} traces over {traces['batch_id'].nunique()} batches")
+    print(f"{'stage':16}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'share':>8}")
+    for stage, stats in stages.items():
+        share = f"{stats['share_of_total']:.0%}" if 'share_of_total' in stats else ''
+        print(f"{stage:16}{stats['mean_ms']:>10.1f}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}"
+              f"{stats['p99_ms']:>10.1f}{share:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+import collections
+import logging
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+
+LEVELS = ['ERROR', 'WARN', 'INFO', 'DEBUG', 'OTHER']
+
+ANSI_ESCAPE = re.compile(r'\x1b\[[0-9;]*[A-Za-z]')
+LEVEL_PATTERN = re.compile(r'\b(FATAL|CRITICAL|ERROR|WARNING|WARN|INFO|DEBUG|TRACE)\b')
+LEVEL_ALIASES = {'FATAL': 'ERROR', 'CRITICAL': 'ERROR', 'WARNING': 'WARN', 'TRACE': 'DEBUG'}
+
+LOG_DIR = os.path.dirname(os.path.abspath(__file__))
+# a `docker logs --follow` still running after this long has found its container
+DOCKER_START_SECONDS = 1
+
+
+def parse_level(line):
+    match = LEVEL_PATTERN.search(line)
+    if match is None:
+        return 'OTHER'
+    return LEVEL_ALIASES.get(match.group(1), match.group(1))
+
+
+class LogTail:
+    # Follows one container's log in a background thread into a bounded ring buffer. Every line gets
+    # a sequence number so readers can ask for just the lines after the last one they have seen.
+    # `docker logs --follow` is used when docker can reach the container, otherwise `fallback_file`
+    # (the bundled *_logs.txt captures) is followed like `tail -f`.
+
+    def __init__(self, container, fallback_file=None, buffer_size=2000, initial_lines=200):
+        self.container = container
+        self.fallback_file = fallback_file
+        self.initial_lines = initial_lines
+
+        self.lines = collections.deque(maxlen=buffer_size)
+        self.next_seq = 0
+        self.source = None
+        self.error = None
+
+        self.lock = threading.Lock()
+        self.pending_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.process = None
+        self.thread = None
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, name=f'log-tail-{self.container}', daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.process is not None:
+            self.process.terminate()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+
+    def _run(self):
+        if shutil.which('docker') is not None and self._follow_docker():
+            return
+        if self.fallback_file and os.path.exists(self.fallback_file):
+            self._follow_file()
+        elif self.error is None:
+            self.error = f"No docker access and no log file for {self.container}"
+
+    def _follow_docker(self):
+        # returns False if docker never produced log lines, so the caller can fall back to the file
+        args = ['--tail', str(self.initial_lines)]
+        backoff = 1
+        received_any = False
+        while not self.stop_event.is_set():
+            started = int(time.time())
+            try:
+                self.process = subprocess.Popen(
+                    ['docker', 'logs', '--follow', *args, self.container],
+                    stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                    text=True, encoding='utf-8', errors='ignore',
+                )
+            except OSError as e:
+                self.error = str(e)
+                return received_any
+
+            # docker's stderr carries the container's stderr stream and docker's own errors ("No such
+            # container", no daemon, permission denied), so it is held back until docker is following
+            pending = []
+            accepted = threading.Event()
+            stderr_thread = threading.Thread(target=self._read_stderr, args=(self.process.stderr, pending, accepted),
+                                             daemon=True)
+            stderr_thread.start()
+            try:
+                return_code = self.process.wait(timeout=DOCKER_START_SECONDS)
+            except subprocess.TimeoutExpired:
+                return_code = None
+
+            if return_code not in (None, 0):
+                output = self.process.stdout.read()
+                stderr_thread.join(timeout=1)
+                if not output:
+                    self.error = (pending[-1].strip() if pending else None) or \
+                        f"docker logs {self.container} exited with code {return_code}"
+                    if not received_any:
+                        return False
+                for line in output.splitlines():
+                    received_any = True
+                    self._add(line)
+            else:
+                self.source = 'docker'
+                self.error = None
+                with self.pending_lock:
+                    for line in pending:
+                        received_any = True
+                        self._add(line)
+                    accepted.set()
+                for line in self.process.stdout:
+                    received_any = True
+                    backoff = 1
+                    self._add(line)
+                self.process.wait()
+                stderr_thread.join(timeout=1)
+
+            if self.stop_event.is_set():
+                break
+            if not received_any:
+                self.error = self.error or f"docker logs {self.container} produced no output"
+                return False
+
+            # the container restarted or the daemon went away: resume from roughly where we stopped
+            logging.warning(f"Log tail for {self.container} ended, retrying in {backoff}s")
+            args = ['--since', str(started)]
+            self.stop_event.wait(backoff)
+            backoff = min(backoff * 2, 30)
+        return True
+
+    def _read_stderr(self, stream, pending, accepted):
+        for line in stream:
+            with self.pending_lock:
+                if accepted.is_set():
+                    self._add(line)
+                else:
+                    pending.append(line)
+
+    def _follow_file(self):
+        self.source = 'file'
+        with open(self.fallback_file, encoding='utf-8', errors='ignore') as f:
+            for line in collections.deque(f, maxlen=self.initial_lines):
+                self._add(line)
+
+            while not self.stop_event.is_set():
+                position = f.tell()
+                line = f.readline()
+                if line:
+                    self._add(line)
+                    continue
+                if os.path.getsize(self.fallback_file) < position:
+                    # truncated or rotated in place
+                    f.seek(0)
+                self.stop_event.wait(0.5)
+
+    def _add(self, line):
+        line = ANSI_ESCAPE.sub('', line.rstrip('\r\n'))
+        level = parse_level(line)
+        with self.lock:
+            self.lines.append((self.next_seq, level, line))
+            self.next_seq += 1
+
+    def read(self, since=0, levels=None):
+        # lines with sequence >= since (optionally only the given levels) and the cursor for the next call;
+        # if the ring buffer already dropped lines past `since`, whatever is still buffered is returned
+        with self.lock:
+            if self.lines and since < self.lines[0][0]:
+                since = self.lines[0][0]
+            start = max(0, since - self.lines[0][0]) if self.lines else 0
+            entries = [self.lines[i] for i in range(start, len(self.lines))]
+            cursor = self.next_seq
+
+        if levels is not None:
+            entries = [entry for entry in entries if entry[1] in levels]
+        return [line for _, _, line in entries], cursor
+
+    def status(self):
+        return {
+            'source': self.source,
+            'error': self.error,
+            'buffered': len(self.lines),
+            'running': self.thread is not None and self.thread.is_alive(),
+        }
+
+
+class LogTailService:
+    # One LogTail per container, all started up front so switching between logs never waits on docker.
+
+    def __init__(self, containers, buffer_size=2000, initial_lines=200):
+        self.tails = {
+            name: LogTail(container, fallback_file=os.path.join(LOG_DIR, log_file) if log_file else None,
+                          buffer_size=buffer_size, initial_lines=initial_lines)
+            for name, (container, log_file) in containers.items()
+        }
+
+    def start(self):
+        for tail in self.tails.values():
+            tail.start()
+        return self
+
+    def stop(self):
+        for tail in self.tails.values():
+            tail.stop()
+
+    def get(self, name):
+        return self.tails[name].start()
@@ -0,0 +1,256 @@
+import argparse
+import atexit
+import csv
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from cassandra.cluster import Cluster
+from cassandra.concurrent import execute_concurrent_with_args
+from cassandra.query import UNSET_VALUE
+
+# Restores cassandra_backup_data.csv (or any CSV with created_users columns) into spark_streams.created_users.
+# The file is streamed in chunks; each chunk is written by one of --workers processes with a prepared insert
+# and up to --concurrency async requests in flight, so large files neither sit in memory nor wait on the GIL.
+# Rows get the same shape as the streaming path: the spark job's projection (its defaults, --spark-config YAML
+# and SPARK_STREAM_* environment) moves the side-table columns to their own table, splits the address and
+# dictionary-encodes columns. The spark job creates the schema when it starts, run it (or the DAG) once after
+# a wipe before restoring.
+
+BACKUP_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cassandra_backup_data.csv')
+KEYSPACE = 'spark_streams'
+TABLE = 'created_users'
+# columns spark_stream.split_address derives from the address when the projection splits it
+ADDRESS_PARTS = ['street', 'city', 'state', 'country']
+
+_session = None
+_inserts = None
+_options = None
+
+
+def split_address(address):
+    # same split as spark_stream.split_address: index from the end so commas inside the street stay in it
+    parts = address.split(', ')
+    return {
+        'country': parts[-1],
+        'state': parts[-2] if len(parts) > 1 else None,
+        'city': parts[-3] if len(parts) > 2 else None,
+        'street': ', '.join(parts[:-3]),
+    }
+
+
+def load_projection(config_path=None):
+    # imported here: spark_stream needs pyspark installed (only to import it, not java)
+    from spark_stream import load_config
+
+    return load_config(['--config', config_path] if config_path else []).projection
+
+
+def column_converter(csv_columns, table_columns, projection, side=False):
+    # maps CSV rows onto one table's columns the way spark_stream.apply_projection does; CSV columns the table
+    # lacks are skipped, and the writer leaves missing (None) values unset
+    side_table = projection.get('side_table')
+    side_columns = side_table['columns'] if side_table else []
+    encoded = projection.get('dictionary_encode', {})
+    dropped = set(projection.get('drop', []))
+
+    if side:
+        sources = ['id'] + side_columns
+    else:
+        sources = [column for column in csv_columns if column not in side_columns]
+        if projection.get('split_address') and 'address' in sources and not projection.get('keep_raw_address'):
+            dropped.add('address')
+    direct = [column for column in sources if column in csv_columns and column not in encoded
+              and column not in dropped and column in table_columns]
+    derived = []
+    if not side and projection.get('split_address') and 'address' in csv_columns:
+        derived = [column for column in ADDRESS_PARTS if column in table_columns and column not in direct]
+    codes = [column for column in encoded if not side and column in csv_columns
+             and f'{column}_code' in table_columns]
+
+    def convert(row):
+        values = [row[column] for column in direct]
+        if derived:
+            parts = split_address(row['address'])
+            values += [parts[column] for column in derived]
+        for column in codes:
+            values.append(encoded[column].index(row[column]) if row[column] in encoded[column] else None)
+        return values
+
+    return direct + derived + [f'{column}_code' for column in codes], convert
+
+
+def read_chunks(path, chunk_size):
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        yield reader.fieldnames
+        while True:
+            chunk = list(itertools.islice(reader, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+
+def init_writer(hosts, cqls, concurrency, max_retries, backoff_seconds):
+    # once per worker process: its own cluster connection and a prepared insert per table
+    global _session, _inserts, _options
+
+    cluster = Cluster(hosts)
+    _session = cluster.connect()
+    atexit.register(cluster.shutdown)
+    _inserts = [_session.prepare(cql) for cql in cqls]
+    _options = {'concurrency': concurrency, 'max_retries': max_retries, 'backoff_seconds': backoff_seconds}
+
+
+def write_rows(insert, rows):
+    # returns (rows written, rows failed, first error); failed rows are retried with exponential backoff.
+    # None is sent unset (no null writes, so no tombstones); swapped in here because UNSET_VALUE is compared
+    # by identity and would not survive pickling to a worker
+    rows = [[UNSET_VALUE if value is None else value for value in values] for values in rows]
+    total = len(rows)
+    error = None
+    for attempt in range(_options['max_retries'] + 1):
+        if attempt:
+            time.sleep(_options['backoff_seconds'] * 2 ** (attempt - 1))
+        results = execute_concurrent_with_args(_session, insert, rows, concurrency=_options['concurrency'],
+                                               raise_on_first_error=False)
+        failed = [(values, result) for values, (success, result) in zip(rows, results) if not success]
+        if not failed:
+            return total, 0, None
+        rows = [values for values, _ in failed]
+        error = repr(failed[0][1])
+
+    return total - len(rows), len(rows), error
+
+
+def write_chunk(table_rows):
+    # one list of rows per table, created_users first; a user counts as restored once its main row is written
+    results = [write_rows(insert, rows) for insert, rows in zip(_inserts, table_rows)]
+    return results[0][0], sum(failed for _, failed, _ in results), next((e for _, _, e in results if e), None)
+
+
+def table_columns(session, table=TABLE):
+    metadata = session.cluster.metadata.keyspaces.get(KEYSPACE, None)
+    metadata = metadata.tables.get(table) if metadata else None
+    if metadata is None:
+        raise SystemExit(f"{KEYSPACE}.{table} does not exist; start the spark job once to create the schema")
+    return list(metadata.columns)
+
+
+def count_restored_rows(session, rows):
+    # keeps the dashboard's row counter in step, like the spark job's increment_row_count
+    if 'row_counts' in session.cluster.metadata.keyspaces[KEYSPACE].tables:
+        session.execute(f"UPDATE {KEYSPACE}.row_counts SET row_count = row_count + %s WHERE table_name = %s",
+                        (rows, TABLE))
+
+
+def restore(args):
+    chunks = read_chunks(args.input, args.chunk_size)
+    csv_columns = next(chunks)
+
+    cluster = Cluster(args.cassandra_hosts)
+    try:
+        session = cluster.connect()
+        projection = load_projection(args.spark_config)
+        tables = [(TABLE, *column_converter(csv_columns, table_columns(session), projection))]
+        side_table = projection.get('side_table')
+        if side_table and set(side_table['columns']) & set(csv_columns):
+            side_columns = table_columns(session, side_table['table'])
+            tables.append((side_table['table'], *column_converter(csv_columns, side_columns, projection, side=True)))
+        if 'id' not in tables[0][1]:
+            raise SystemExit(f"{args.input} has no id column")
+        restored = {column for _, columns, _ in tables for column in columns}
+        skipped = [column for column in csv_columns if column not in restored and f'{column}_code' not in restored
+                   and not (column == 'address' and set(ADDRESS_PARTS) & restored)]
+        if skipped:
+            logging.warning(f"Columns not in {KEYSPACE}.{TABLE} after the projection, not restored: {skipped}")
+
+        cqls = [f"INSERT INTO {KEYSPACE}.{table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+                for table, columns, _ in tables]
+        writer_args = (args.cassandra_hosts, cqls, args.concurrency, args.max_retries, args.backoff_seconds)
+        totals = {'rows': 0, 'failed': 0, 'chunks': 0}
+        first_error = None
+        started = last_report = time.perf_counter()
+
+        def collect(result):
+            nonlocal first_error, last_report
+            written, failed, error = result
+            totals['rows'] += written
+            totals['failed'] += failed
+            totals['chunks'] += 1
+            first_error = first_error or error
+            now = time.perf_counter()
+            if now - last_report >= args.progress_seconds:
+                last_report = now
+                logging.info(f"{totals['rows']} rows restored, {totals['rows'] / (now - started):.0f} rows/s")
+
+        converted = ([[convert(row) for row in chunk] for _, _, convert in tables] for chunk in chunks)
+        if args.workers == 1:
+            init_writer(*writer_args)
+            for rows in converted:
+                collect(write_chunk(rows))
+        else:
+            # spawn: the parent's cassandra connections must not be shared with forked children
+            with ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context('spawn'),
+                                     initializer=init_writer, initargs=writer_args) as pool:
+                pending = set()
+                for rows in converted:
+                    # two chunks queued per worker keeps them busy without reading the whole file ahead
+                    if len(pending) >= 2 * args.workers:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            collect(future.result())
+                    pending.add(pool.submit(write_chunk, rows))
+                for future in pending:
+                    collect(future.result())
+
+        elapsed = time.perf_counter() - started
+        if totals['rows'] and not args.no_row_count:
+            count_restored_rows(session, totals['rows'])
+    finally:
+        cluster.shutdown()
+
+    return {
+        'input': args.input,
+        'table': f'{KEYSPACE}.{TABLE}',
+        'columns': {table: columns for table, columns, _ in tables},
+        **totals,
+        'seconds': round(elapsed, 2),
+        'rows_per_second': round(totals['rows'] / elapsed) if elapsed else None,
+        'workers': args.workers,
+        'concurrency': args.concurrency,
+        'first_error': first_error,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=f"Restore a CSV backup into {KEYSPACE}.{TABLE}")
+    parser.add_argument('--input', default=BACKUP_CSV)
+    parser.add_argument('--cassandra-hosts', nargs='+', default=['localhost'])
+    parser.add_argument('--spark-config', help="the spark job's YAML config, for its projection "
+                                               "(default: SPARK_STREAM_CONFIG, else the defaults)")
+    parser.add_argument('--chunk-size', type=int, default=5000, help="rows read and written per chunk")
+    parser.add_argument('--workers', type=int, default=max(1, min(4, os.cpu_count() or 1)),
+                        help="writer processes")
+    parser.add_argument('--concurrency', type=int, default=100, help="async writes in flight per worker")
+    parser.add_argument('--max-retries', type=int, default=3)
+    parser.add_argument('--backoff-seconds', type=float, default=0.5)
+    parser.add_argument('--progress-seconds', type=float, default=5)
+    parser.add_argument('--no-row-count', action='store_true', help="leave spark_streams.row_counts alone")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    summary = restore(parse_args(argv))
+    print(json.dumps(summary, indent=2))
+    if summary['failed']:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,319 @@
+import argparse
+import atexit
+import copy
+import functools
+import importlib
+import json
 import logging
+import math
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from dataclasses import dataclass, field, fields, asdict, replace
+from typing import Optional
 
+from cassandra import OperationTimedOut, WriteTimeout, Unavailable
 from cassandra.cluster import Cluster
+from cassandra.concurrent import execute_concurrent_with_args
+from cassandra.protocol import OverloadedErrorMessage
+from pyspark import AccumulatorParam
 from pyspark.sql import SparkSession
-from pyspark.sql.functions import from_json, col
-from pyspark.sql.types import StructType, StructField, StringType
+from pyspark.sql.functions import from_json, col, when, lit, to_json, struct, get_json_object, concat_ws, lower, \
+    split, element_at, expr, create_map, to_date, floor, unix_timestamp, substring, size
+from pyspark.sql.types import StructType, StructField, StringType, IntegerType, LongType, TimestampType
+
+# shared with the producer DAG: in dags/ in the repo, next to this file when both are copied into a container
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dags'))
+import structured_logging
+from structured_logging import configure_logger
+
+# fields that must be present for a row to be written to cassandra
+DEFAULT_REQUIRED_FIELDS = ['id', 'first_name', 'last_name', 'email', 'username']
+
+# projection applied to valid rows before they reach the cassandra sink
+#   drop:              columns that are not written to cassandra
+#   side_table:        heavy columns moved to their own table keyed by id
+#   split_address:     replace the free-text address with street/city/state/country
+#   keep_raw_address:  also keep the original address string
+#   dictionary_encode: column -> known values, written as <column>_code INT instead of text
+#                      (e.g. {'gender': ['female', 'male']}; the dashboard still reads text gender)
+DEFAULT_PROJECTION = {
+    'drop': ['kafka_timestamp'],
+    'side_table': {'table': 'user_pictures', 'columns': ['picture']},
+    'split_address': True,
+    'keep_raw_address': False,
+    'dictionary_encode': {},
+}
+
+# latency tracing: stamps added by the producer (epoch ms) and by foreach_batch_function; they are
+# written to pipeline_traces by the latency_traces sink and never to the user tables
+PAYLOAD_TRACE_FIELDS = ['trace_id', 'fetch_started_at', 'fetched_at', 'produced_at']
+TRACE_COLUMNS = PAYLOAD_TRACE_FIELDS + ['batch_started_at', 'batch_processed_at']
+
+# upper bounds (ms) of the latency histogram merged back to the driver
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float('inf')]
+
+CQL_TYPES = {
+    StringType(): 'TEXT',
+    IntegerType(): 'INT',
+    LongType(): 'BIGINT',
+    TimestampType(): 'TIMESTAMP',
+}
+
+SINK_MODES = ['partition', 'connector']
+MODES = ['stream', 'backfill', 'backfill_then_stream']
+# batch_id the backfill's single batch is written with (dlq, traces); streaming batches count up from 0
+BACKFILL_BATCH_ID = -1
+ENV_PREFIX = 'SPARK_STREAM_'
+LOG_FORMATS = ['json', 'text']
+
+logger = logging.getLogger('spark_stream')
+
+
+def configure_logging(level='INFO', log_format='json'):
+    configure_logger(logger, level, log_format)
+
+
+def log_event(level, message, **fields):
+    if logger.isEnabledFor(level):
+        logger.log(level, message, extra={'fields': fields})
+
+
+def log_sampled(level, rate, message, **fields):
+    # for per-record and per-partition events: only a `rate` fraction is logged, tagged with the rate
+    if logger.isEnabledFor(level) and random.random() < rate:
+        log_event(level, message, sample_rate=rate, **fields)
+
+
+@dataclass
+class StreamConfig:
+    kafka_bootstrap_servers: str = 'localhost:9092'
+    topics: list = field(default_factory=lambda: ['users_data'])
+    # 'latest', 'earliest' or a per-partition JSON offsets spec
+    starting_offsets: str = 'latest'
+    # epoch ms; the stream starts at the first record at or after it instead of at starting_offsets
+    starting_timestamp: Optional[int] = None
+    max_offsets_per_trigger: Optional[int] = None
+    # e.g. '10 seconds'; None starts the next batch as soon as the previous one finishes
+    trigger_interval: Optional[str] = None
+    checkpoint_location: str = '/tmp/checkpoint'
+    dlq_topic: str = 'users_data_dlq'
+    # latest record per user id; create it with --config cleanup.policy=compact so kafka keeps only the last value
+    compacted_topic: str = 'users_data_compacted'
+
+    # 'stream', 'backfill' (read a bounded range with the batch kafka source, write it and exit) or
+    # 'backfill_then_stream' (then stream on from exactly where the backfill ended)
+    mode: str = 'stream'
+    backfill_starting_offsets: str = 'earliest'
+    backfill_starting_timestamp: Optional[int] = None  # epoch ms, instead of backfill_starting_offsets
+    # end of the range (exclusive): a per-partition JSON offsets spec, or else a timestamp in epoch ms
+    # (default: when the job starts)
+    backfill_ending_offsets: Optional[str] = None
+    backfill_ending_timestamp: Optional[int] = None
+    # spark tasks the kafka range is read and written with; None -> 4x spark default parallelism
+    backfill_partitions: Optional[int] = None
+
+    cassandra_hosts: list = field(default_factory=lambda: ['localhost'])
+    # worker threads of each python driver cluster (one per executor python worker)
+    cassandra_executor_threads: int = 2
+
+    # every valid micro-batch is written to each of these sinks (see SINKS below)
+    sinks: list = field(default_factory=lambda: ['cassandra', 'recent_users', 'aggregates', 'search_index'])
+    parquet_path: str = '/tmp/spark_streams/created_users_parquet'
+    # every N batches the parquet sink merges the small per-batch files of each ingest_date partition into
+    # files of about parquet_target_file_mb, once a partition has parquet_compaction_min_files of them;
+    # None turns compaction off
+    parquet_compaction_every: Optional[int] = 50
+    parquet_compaction_min_files: int = 16
+    parquet_target_file_mb: int = 128
+    # 'partition' writes from the executors with the python driver, 'connector' uses the spark cassandra connector
+    sink_mode: str = 'partition'
+    sink_partitions: Optional[int] = None  # None -> spark default parallelism (the worker cores)
+    sink_max_concurrency: int = 32  # in-flight async writes per partition
+    sink_max_retries: int = 5
+    sink_backoff_seconds: float = 0.05
+
+    required_fields: list = field(default_factory=lambda: list(DEFAULT_REQUIRED_FIELDS))
+    projection: dict = field(default_factory=lambda: copy.deepcopy(DEFAULT_PROJECTION))
+    # extra spark conf, e.g. spark.cassandra.output.concurrent.writes or spark.sql.shuffle.partitions
+    spark_conf: dict = field(default_factory=dict)
+
+    log_level: str = 'INFO'
+    log_format: str = 'json'  # or 'text'
+    # fraction of per-partition events (executor write summaries) that are logged
+    log_sample_rate: float = 0.01
+
+
+# settings that differ between running on the host and inside the docker network
+PROFILES = {
+    'local': {},
+    'docker': {
+        'kafka_bootstrap_servers': 'broker:29092',
+        'cassandra_hosts': ['cassandra'],
+        'starting_offsets': 'earliest',
+        # bind-mounted from ./analytics on the spark containers, read by the dashboard
+        'parquet_path': '/opt/analytics/created_users',
+    },
+}
+
+
+def coerce_config_value(value, field_type):
+    if value is None or not isinstance(value, str):
+        return value
+
+    if field_type is list:
+        return [item.strip() for item in value.split(',') if item.strip()]
+    if field_type is dict:
+        return json.loads(value)
+    if field_type == Optional[int]:
+        return None if value.lower() in ('', 'none') else int(value)
+    if field_type == Optional[str]:
+        return None if value.lower() in ('', 'none') else value
+    if field_type in (int, float):
+        return field_type(value)
+
+    return value
+
+
+CONFIG_TYPE_CHECKS = {
+    str: str,
+    int: int,
+    float: (int, float),
+    list: list,
+    dict: dict,
+    Optional[int]: (int, type(None)),
+    Optional[str]: (str, type(None)),
+}
+
+
+def validate_config(config):
+    errors = []
+
+    for config_field in fields(config):
+        value = getattr(config, config_field.name)
+        if not isinstance(value, CONFIG_TYPE_CHECKS[config_field.type]):
+            errors.append(f"{config_field.name} has the wrong type: {value!r}")
+    if errors:
+        raise ValueError("Invalid spark_stream configuration:\n  " + "\n  ".join(errors))
+
+    if not config.kafka_bootstrap_servers:
+        errors.append("kafka_bootstrap_servers must not be empty")
+    if not config.topics:
+        errors.append("topics must list at least one topic")
+    if not config.cassandra_hosts:
+        errors.append("cassandra_hosts must list at least one host")
+    if config.starting_offsets not in ('latest', 'earliest') and not config.starting_offsets.startswith('{'):
+        errors.append(f"starting_offsets must be 'latest', 'earliest' or a JSON offsets spec, "
+                      f"got {config.starting_offsets!r}")
+    if config.mode not in MODES:
+        errors.append(f"mode must be one of {MODES}, got {config.mode!r}")
+    if config.backfill_starting_offsets != 'earliest' and not config.backfill_starting_offsets.startswith('{'):
+        errors.append(f"backfill_starting_offsets must be 'earliest' or a JSON offsets spec, "
+                      f"got {config.backfill_starting_offsets!r}")
+    if config.backfill_ending_offsets is not None and not config.backfill_ending_offsets.startswith('{'):
+        errors.append(f"backfill_ending_offsets must be a JSON offsets spec, got {config.backfill_ending_offsets!r}")
+    if None not in (config.backfill_starting_timestamp, config.backfill_ending_timestamp) \
+            and config.backfill_starting_timestamp >= config.backfill_ending_timestamp:
+        errors.append("backfill_starting_timestamp must be before backfill_ending_timestamp")
+    if config.sink_mode not in SINK_MODES:
+        errors.append(f"sink_mode must be one of {SINK_MODES}, got {config.sink_mode!r}")
+
+    unknown_sinks = [name for name in config.sinks if name not in SINKS]
+    if unknown_sinks:
+        errors.append(f"unknown sinks {unknown_sinks}, available: {sorted(SINKS)}")
+
+    for name in ('max_offsets_per_trigger', 'sink_partitions', 'sink_max_concurrency', 'cassandra_executor_threads',
+                 'backfill_partitions', 'parquet_compaction_every', 'parquet_compaction_min_files',
+                 'parquet_target_file_mb'):
+        value = getattr(config, name)
+        if value is not None and value < 1:
+            errors.append(f"{name} must be at least 1, got {value}")
+    if config.sink_max_retries < 0:
+        errors.append(f"sink_max_retries must not be negative, got {config.sink_max_retries}")
+    if config.log_level not in ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'):
+        errors.append(f"log_level must be a logging level name, got {config.log_level!r}")
+    if config.log_format not in LOG_FORMATS:
+        errors.append(f"log_format must be one of {LOG_FORMATS}, got {config.log_format!r}")
+    if not 0 <= config.log_sample_rate <= 1:
+        errors.append(f"log_sample_rate must be between 0 and 1, got {config.log_sample_rate}")
+    if config.sink_backoff_seconds < 0:
+        errors.append(f"sink_backoff_seconds must not be negative, got {config.sink_backoff_seconds}")
+
+    unknown_projection_keys = set(config.projection) - set(DEFAULT_PROJECTION)
+    if unknown_projection_keys:
+        errors.append(f"unknown projection keys {sorted(unknown_projection_keys)}")
+
+    if errors:
+        raise ValueError("Invalid spark_stream configuration:\n  " + "\n  ".join(errors))
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Stream users_data from Kafka into Cassandra")
+    parser.add_argument('--config', help=f"YAML file with config overrides (env: {ENV_PREFIX}CONFIG)")
+    parser.add_argument('--profile', choices=sorted(PROFILES),
+                        help=f"host/offset preset, default local (env: {ENV_PREFIX}PROFILE)")
+    parser.add_argument('--conf', action='append', default=[], metavar='KEY=VALUE',
+                        help="spark conf override, may be repeated")
+
+    for config_field in fields(StreamConfig):
+        if config_field.name in ('projection', 'spark_conf'):
+            continue
+        parser.add_argument(f"--{config_field.name.replace('_', '-')}", dest=config_field.name,
+                            help=f"env: {ENV_PREFIX}{config_field.name.upper()}")
+
+    return parser.parse_args(argv)
+
+
+def load_config(argv=None, environ=None):
+    # precedence: defaults < profile < YAML file < environment < command line
+    environ = os.environ if environ is None else environ
+    args = parse_args(argv)
+    field_types = {config_field.name: config_field.type for config_field in fields(StreamConfig)}
+
+    values = asdict(StreamConfig())
+
+    profile = args.profile or environ.get(f'{ENV_PREFIX}PROFILE', 'local')
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown profile {profile!r}, available: {sorted(PROFILES)}")
+    values.update(copy.deepcopy(PROFILES[profile]))
+
+    config_path = args.config or environ.get(f'{ENV_PREFIX}CONFIG')
+    if config_path:
+        import yaml
+
+        with open(config_path) as config_file:
+            file_values = yaml.safe_load(config_file) or {}
+        unknown_keys = set(file_values) - set(field_types)
+        if unknown_keys:
+            raise ValueError(f"Unknown keys in {config_path}: {sorted(unknown_keys)}")
+        for name, value in file_values.items():
+            # partial projection / spark_conf blocks extend the defaults instead of replacing them
+            if isinstance(values[name], dict) and isinstance(value, dict):
+                values[name].update(value)
+            else:
+                values[name] = value
+
+    for name, field_type in field_types.items():
+        env_value = environ.get(f'{ENV_PREFIX}{name.upper()}')
+        if env_value is not None:
+            values[name] = coerce_config_value(env_value, field_type)
+
+    for name, field_type in field_types.items():
+        arg_value = getattr(args, name, None)
+        if arg_value is not None:
+            values[name] = coerce_config_value(arg_value, field_type)
+
+    for item in args.conf:
+        key, _, value = item.partition('=')
+        values['spark_conf'][key] = value
+
+    config = StreamConfig(**values)
+    validate_config(config)
+
+    return config
 
 
 def create_keyspace(session):
@@ -12,8 +322,7 @@ def create_keyspace(session):
         WITH replication = {'class': 'SimpleStrategy', 'replication_factor': '1'};
     """)
 
-    print("Cassandra - Keyspace created successfully!")
-    print("********************************************************")
+    log_event(logging.INFO, "Keyspace ready", keyspace='spark_streams')
 
 
 def create_table(session):
@@ -32,8 +341,147 @@ def create_table(session):
         picture TEXT);
     """)
 
-    print("Cassandra Table created successfully!")
-    print("********************************************************")
+    log_event(logging.INFO, "Table ready", table='spark_streams.created_users')
+
+
+def create_recent_users_table(session):
+    # users clustered by ingest time in hourly partitions, so the dashboard can fetch only rows newer than
+    # the last one it has seen; rows expire after a week to keep the table small
+    session.execute("""
+    CREATE TABLE IF NOT EXISTS spark_streams.recent_users_by_hour (
+        ingest_hour BIGINT,
+        ingest_ts TIMESTAMP,
+        id TEXT,
+        username TEXT,
+        first_name TEXT,
+        gender TEXT,
+        email TEXT,
+        registered_date TEXT,
+        PRIMARY KEY ((ingest_hour), ingest_ts, id))
+    WITH CLUSTERING ORDER BY (ingest_ts DESC, id ASC)
+    AND default_time_to_live = 604800;
+    """)
+
+    log_event(logging.INFO, "Table ready", table='spark_streams.recent_users_by_hour')
+
+
+def create_aggregate_tables(session):
+    # pre-aggregated chart data maintained by the aggregates sink, so the dashboard reads counts, not rows
+    session.execute("""
+    CREATE TABLE IF NOT EXISTS spark_streams.user_counts_by_dimension (
+        dimension TEXT,
+        value TEXT,
+        row_count COUNTER,
+        PRIMARY KEY ((dimension), value));
+    """)
+    session.execute("""
+    CREATE TABLE IF NOT EXISTS spark_streams.ingest_counts_by_minute (
+        ingest_day BIGINT,
+        minute TIMESTAMP,
+        row_count COUNTER,
+        PRIMARY KEY ((ingest_day), minute));
+    """)
+
+    log_event(logging.INFO, "Tables ready", tables=['spark_streams.user_counts_by_dimension', 'spark_streams.ingest_counts_by_minute'])
+
+
+# columns the dashboard can search on; prefix lookups are partitioned by the first SEARCH_BUCKET_LENGTH characters
+SEARCH_FIELDS = ['email', 'username', 'last_name']
+SEARCH_BUCKET_LENGTH = 2
+
+
+def create_search_indexes(session):
+    # SAI indexes for case-insensitive equality lookups on created_users (cassandra 5+)
+    for search_field in SEARCH_FIELDS:
+        try:
+            session.execute(f"""
+            CREATE CUSTOM INDEX IF NOT EXISTS created_users_{search_field}_idx
+            ON spark_streams.created_users ({search_field}) USING 'StorageAttachedIndex'
+            WITH OPTIONS = {{'case_sensitive': 'false', 'normalize': 'true'}};
+            """)
+        except Exception as e:
+            log_event(logging.WARNING, "Could not create SAI index", column=f"created_users.{search_field}", error=str(e))
+
+    # SAI has no prefix matching, so prefixes go through a lookup table kept by the search_index sink:
+    # one partition per (field, leading characters), clustered by the lowercased value for range scans
+    session.execute("""
+    CREATE TABLE IF NOT EXISTS spark_streams.users_by_prefix (
+        field TEXT,
+        bucket TEXT,
+        value TEXT,
+        id TEXT,
+        username TEXT,
+        first_name TEXT,
+        last_name TEXT,
+        email TEXT,
+        PRIMARY KEY ((field, bucket), value, id));
+    """)
+
+    log_event(logging.INFO, "Search indexes ready", table='spark_streams.users_by_prefix', indexed=SEARCH_FIELDS)
+
+
+def create_trace_table(session):
+    # one row per traced record, all stamps in epoch ms; WRITETIME(batch_processed_at) marks when the batch's
+    # writes were done, since the latency_traces sink runs after the other sinks
+    session.execute("""
+    CREATE TABLE IF NOT EXISTS spark_streams.pipeline_traces (
+        trace_id TEXT PRIMARY KEY,
+        id TEXT,
+        batch_id BIGINT,
+        fetch_started_at BIGINT,
+        fetched_at BIGINT,
+        produced_at BIGINT,
+        kafka_ts BIGINT,
+        batch_started_at BIGINT,
+        batch_processed_at BIGINT)
+    WITH default_time_to_live = 604800;
+    """)
+
+    log_event(logging.INFO, "Table ready", table='spark_streams.pipeline_traces')
+
+
+def create_counter_table(session):
+    # lets the dashboard read the row count from one partition instead of running count(*) over the table
+    session.execute("""
+    CREATE TABLE IF NOT EXISTS spark_streams.row_counts (
+        table_name TEXT PRIMARY KEY,
+        row_count COUNTER);
+    """)
+
+    log_event(logging.INFO, "Table ready", table='spark_streams.row_counts')
+
+
+def increment_row_count(session, table, rows):
+    # counts writes, so replayed batches and re-sent ids are counted again; the dashboard's exact count corrects it
+    session.execute(
+        "UPDATE spark_streams.row_counts SET row_count = row_count + %s WHERE table_name = %s",
+        (rows, table)
+    )
+
+
+def create_side_table(session, projection):
+    side_table = projection.get('side_table')
+    if not side_table:
+        return
+
+    columns = ",\n        ".join(f"{c} TEXT" for c in side_table['columns'])
+    session.execute(f"""
+    CREATE TABLE IF NOT EXISTS spark_streams.{side_table['table']} (
+        id TEXT PRIMARY KEY,
+        {columns});
+    """)
+
+    log_event(logging.INFO, "Table ready", table=f"spark_streams.{side_table['table']}")
+
+
+def sync_table_columns(session, table, schema):
+    # CREATE TABLE IF NOT EXISTS leaves existing tables alone, so add any column the projection introduced
+    table_meta = session.cluster.metadata.keyspaces['spark_streams'].tables[table]
+
+    for field in schema.fields:
+        if field.name not in table_meta.columns:
+            session.execute(f"ALTER TABLE spark_streams.{table} ADD {field.name} {CQL_TYPES.get(field.dataType, 'TEXT')}")
+            log_event(logging.INFO, "Column added", table=f"spark_streams.{table}", column=field.name)
 
 
 def insert_data(session, **kwargs):
@@ -58,73 +506,103 @@ def insert_data(session, **kwargs):
                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
         """, (user_id, first_name, last_name, gender, address,
               postcode, email, username, dob, registered_date, phone, picture))
-        print(f"Data inserted for {first_name} {last_name}")
-        print("********************************************************")
+        log_event(logging.DEBUG, "Row inserted", id=user_id)
 
     except Exception as e:
-        print(f'could not insert data due to {e}')
-        print("********************************************************")
+        log_event(logging.ERROR, "Could not insert row", id=user_id, error=str(e))
 
 
-def create_spark_connection():
+def create_spark_connection(config):
     s_conn = None
 
     try:
-        print("Creating spark session!")
-        print("********************************************************")
-        s_conn = SparkSession.builder \
+        builder = SparkSession.builder \
             .appName('SparkDataStreaming') \
             .config('spark.jars.packages', "com.datastax.spark:spark-cassandra-connector_2.12:3.4.0,"
                                            "org.apache.spark:spark-sql-kafka-0-10_2.12:3.5.0") \
-            .config('spark.cassandra.connection.host', 'localhost') \
-            .getOrCreate()
+            .config('spark.cassandra.connection.host', ','.join(config.cassandra_hosts))
+
+        for key, value in config.spark_conf.items():
+            builder = builder.config(key, value)
+
+        s_conn = builder.getOrCreate()
 
         s_conn.sparkContext.setLogLevel("ERROR")
-        print("Spark connection created successfully!")
-        print("********************************************************")
+        log_event(logging.INFO, "Spark session created", app=s_conn.sparkContext.appName)
     except Exception as e:
-        print(f"Couldn't create the spark session due to exception {e}")
-        print("********************************************************")
+        logger.exception("Could not create the spark session")
 
     return s_conn
 
 
-def connect_to_kafka(spark_conn):
+def connect_to_kafka(spark_conn, config):
     spark_df = None
     try:
-        spark_df = spark_conn.readStream \
+        reader = spark_conn.readStream \
             .format('kafka') \
-            .option('kafka.bootstrap.servers', 'localhost:9092') \
-            .option('subscribe', 'users_data') \
-            .option('startingOffsets', 'latest') \
-            .load()
+            .option('kafka.bootstrap.servers', config.kafka_bootstrap_servers) \
+            .option('subscribe', ','.join(config.topics))
+
+        if config.starting_timestamp is not None:
+            # partitions without a record at or after the timestamp start at their latest offset
+            reader = reader.option('startingTimestamp', str(config.starting_timestamp)) \
+                .option('startingOffsetsByTimestampStrategy', 'latest')
+        else:
+            reader = reader.option('startingOffsets', config.starting_offsets)
+
+        if config.max_offsets_per_trigger:
+            reader = reader.option('maxOffsetsPerTrigger', config.max_offsets_per_trigger)
+
+        spark_df = reader.load()
 
-        print("kafka dataframe created successfully")
-        print("********************************************************")
+        log_event(logging.INFO, "Kafka source created", topics=config.topics,
+                  bootstrap_servers=config.kafka_bootstrap_servers, starting_offsets=config.starting_offsets,
+                  starting_timestamp=config.starting_timestamp)
     except Exception as e:
-        print(f"kafka dataframe could not be created because: {e}")
-        print("********************************************************")
+        logger.exception("Could not create the kafka source")
 
     return spark_df
 
 
-def create_cassandra_connection():
+def read_kafka_range(spark_conn, config, ending_timestamp, num_partitions):
+    # Bounded batch read for backfills: no trigger loop, offset log or state store, and minPartitions splits
+    # each kafka partition's range over several tasks, so a single-partition topic is still read in parallel.
+    reader = spark_conn.read \
+        .format('kafka') \
+        .option('kafka.bootstrap.servers', config.kafka_bootstrap_servers) \
+        .option('subscribe', ','.join(config.topics)) \
+        .option('minPartitions', num_partitions)
+
+    if config.backfill_starting_timestamp is not None:
+        reader = reader.option('startingTimestamp', str(config.backfill_starting_timestamp)) \
+            .option('startingOffsetsByTimestampStrategy', 'latest')
+    else:
+        reader = reader.option('startingOffsets', config.backfill_starting_offsets)
+
+    if config.backfill_ending_offsets is not None:
+        reader = reader.option('endingOffsets', config.backfill_ending_offsets)
+    else:
+        # per partition: the first offset at or after the timestamp, or the latest offset if there is none yet
+        reader = reader.option('endingTimestamp', str(ending_timestamp))
+
+    return reader.load()
+
+
+def create_cassandra_connection(config):
     try:
         # connecting to the cassandra cluster
-        cluster = Cluster(['localhost'])
+        cluster = Cluster(config.cassandra_hosts)
 
         cas_session = cluster.connect()
-        print("Cassandra session created succesfully!")
-        print("********************************************************")
+        log_event(logging.INFO, "Cassandra session created", hosts=config.cassandra_hosts)
 
         return cas_session
     except Exception as e:
-        print(f"Could not create cassandra connection due to {e}")
-        print("********************************************************")
+        logger.exception("Could not connect to cassandra")
         return None
 
 
-def create_selection_df_from_kafka(spark_df):
+def create_selection_df_from_kafka(spark_df, required_fields=DEFAULT_REQUIRED_FIELDS):
     schema = StructType([
         StructField("id", StringType(), False),
         StructField("first_name", StringType(), False),
@@ -136,45 +614,734 @@ def create_selection_df_from_kafka(spark_df):
         StructField("username", StringType(), False),
         StructField("registered_date", StringType(), False),
         StructField("phone", StringType(), False),
-        StructField("picture", StringType(), False)
+        StructField("picture", StringType(), False),
+        # optional latency trace stamps, absent in payloads from older producers
+        StructField("trace_id", StringType(), True),
+        StructField("fetch_started_at", LongType(), True),
+        StructField("fetched_at", LongType(), True),
+        StructField("produced_at", LongType(), True),
     ])
 
-    sel = spark_df.selectExpr("CAST(value AS STRING)") \
-        .select(from_json(col('value'), schema).alias('data')).select("data.*")
+    # keep the raw payload and kafka coordinates around so rejected rows can be dead-lettered
+    raw = spark_df.selectExpr("CAST(value AS STRING) AS value", "topic", "partition", "offset", "timestamp")
+    parsed = raw.withColumn('data', from_json(col('value'), schema))
+
+    missing = concat_ws(',', *[when(col(f'data.{name}').isNull(), lit(name)) for name in required_fields])
+
+    sel = parsed.withColumn(
+        'error_reason',
+        when(col('value').isNull() | (col('value') == ''), lit('empty_payload'))
+        .when(get_json_object(col('value'), '$').isNull() | col('data').isNull(), lit('malformed_json'))
+        .when(missing != '', concat_ws(':', lit('missing_fields'), missing))
+    )
 
     return sel
 
-def foreach_batch_function(df, epoch_id):
-    # Print each micro-batch for debugging
-    print("Records inserted..")
-    print("\n")
-    print(f"Batch {epoch_id}")
-    df.show()
-    print("********************************************************")
 
-if __name__ == "__main__":
+def split_valid_invalid(batch_df):
+    valid_df = batch_df.filter(col('error_reason').isNull()) \
+        .select("data.*", col('timestamp').alias('kafka_timestamp'))
+    invalid_df = batch_df.filter(col('error_reason').isNotNull())
+
+    return valid_df, invalid_df
+
+
+def drop_trace_columns(valid_df):
+    return valid_df.drop(*[c for c in TRACE_COLUMNS if c in valid_df.columns])
+
+
+def write_to_dlq(invalid_df, epoch_id, config):
+    dlq_df = invalid_df.select(
+        col('data.id').alias('key'),
+        to_json(struct(
+            col('value').alias('payload'),
+            col('error_reason'),
+            col('topic').alias('source_topic'),
+            col('partition').alias('source_partition'),
+            col('offset').alias('source_offset'),
+            col('timestamp').alias('source_timestamp'),
+            lit(epoch_id).alias('batch_id')
+        )).alias('value')
+    )
+
+    dlq_df.write \
+        .format('kafka') \
+        .option('kafka.bootstrap.servers', config.kafka_bootstrap_servers) \
+        .option('topic', config.dlq_topic) \
+        .save()
+
+
+def split_address(df):
+    # format_data builds "<number> <street>, <city>, <state>, <country>"; index from the end so
+    # commas inside the street name stay in the street. Shorter addresses get an empty street and null for
+    # the parts they lack, as in restore_backup.split_address; slice and (with ANSI on) element_at throw on
+    # out-of-range arguments, which would fail the whole batch.
+    parts = split(col('address'), ', ')
+
+    return df \
+        .withColumn('country', element_at(parts, -1)) \
+        .withColumn('state', when(size(parts) >= 2, element_at(parts, -2))) \
+        .withColumn('city', when(size(parts) >= 3, element_at(parts, -3))) \
+        .withColumn('street', expr("array_join(slice(split(address, ', '), 1, "
+                                   "greatest(size(split(address, ', ')) - 3, 0)), ', ')"))
+
+
+def dictionary_encode(df, column, values):
+    codes = create_map(*[item for i, value in enumerate(values) for item in (lit(value), lit(i))])
+
+    return df.withColumn(f'{column}_code', element_at(codes, col(column)).cast(IntegerType())).drop(column)
+
+
+def apply_projection(valid_df, projection=DEFAULT_PROJECTION):
+    side_df = None
+    side_table = projection.get('side_table')
+    if side_table:
+        side_df = valid_df.select('id', *side_table['columns'])
+        valid_df = valid_df.drop(*side_table['columns'])
+
+    if projection.get('split_address'):
+        valid_df = split_address(valid_df)
+        if not projection.get('keep_raw_address'):
+            valid_df = valid_df.drop('address')
+
+    for column, values in projection.get('dictionary_encode', {}).items():
+        valid_df = dictionary_encode(valid_df, column, values)
+
+    valid_df = valid_df.drop(*projection.get('drop', []))
+
+    return valid_df, side_df
+
+
+class WriteStatsParam(AccumulatorParam):
+    # merges the per-partition write stats produced on the executors
+
+    def zero(self, value):
+        return empty_write_stats()
+
+    def addInPlace(self, value1, value2):
+        value1['rows'] += value2['rows']
+        value1['partitions'] += value2['partitions']
+        value1['retries'] += value2['retries']
+        value1['failures'] += value2['failures']
+        value1['backoff_seconds'] += value2['backoff_seconds']
+        value1['max_partition_seconds'] = max(value1['max_partition_seconds'], value2['max_partition_seconds'])
+        value1['latency_buckets'] = [a + b for a, b in zip(value1['latency_buckets'], value2['latency_buckets'])]
+        return value1
+
+
+def empty_write_stats():
+    return {
+        'rows': 0,
+        'partitions': 0,
+        'retries': 0,
+        'failures': 0,
+        'backoff_seconds': 0.0,
+        'max_partition_seconds': 0.0,
+        'latency_buckets': [0] * len(LATENCY_BUCKETS_MS),
+    }
+
+
+def latency_percentile(stats, percentile):
+    total = sum(stats['latency_buckets'])
+    if total == 0:
+        return 0
+
+    threshold = total * percentile / 100
+    seen = 0
+    for bound, count in zip(LATENCY_BUCKETS_MS, stats['latency_buckets']):
+        seen += count
+        if seen >= threshold:
+            return bound
+    return LATENCY_BUCKETS_MS[-1]
+
+
+# One cluster/session per python worker process, reused by every partition and batch it runs.
+# Executors import this file as a module (see ship_module_to_executors) so the cache outlives a task;
+# state on a closure shipped from __main__ would be rebuilt for every partition.
+_executor_session = None
+_prepared_statements = {}
+
+
+def get_executor_session(hosts, executor_threads=2):
+    global _executor_session
+
+    if _executor_session is None:
+        cluster = Cluster(hosts, executor_threads=executor_threads)
+        _executor_session = cluster.connect()
+        atexit.register(cluster.shutdown)
+
+    return _executor_session
+
+
+def get_prepared(session, cql):
+    if cql not in _prepared_statements:
+        _prepared_statements[cql] = session.prepare(cql)
+
+    return _prepared_statements[cql]
+
+
+def get_prepared_insert(session, table, columns):
+    placeholders = ', '.join('?' for _ in columns)
+    return get_prepared(session, f"INSERT INTO spark_streams.{table} ({', '.join(columns)}) VALUES ({placeholders})")
+
+
+class PartitionWriter:
+    # Keeps at most `limit` async writes in flight. Timeouts and overload errors halve the limit and
+    # pause submission (backpressure); successful writes grow it back one slot at a time.
+
+    RETRYABLE_ERRORS = (OperationTimedOut, WriteTimeout, Unavailable, OverloadedErrorMessage)
+
+    def __init__(self, session, statement, max_concurrency, max_retries, backoff_seconds):
+        self.session = session
+        self.statement = statement
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+
+        self.limit = max_concurrency
+        self.in_flight = 0
+        self.pause_until = 0.0
+        self.condition = threading.Condition()
+        self.retry_queue = queue.Queue()
+        self.errors = []
+        self.stats = empty_write_stats()
+
+    def submit(self, values):
+        self._drain_retries()
+        self._send(values, 0)
+
+    def _send(self, values, attempt):
+        with self.condition:
+            while self.in_flight >= self.limit:
+                self.condition.wait()
+            self.in_flight += 1
+
+        delay = self.pause_until - time.monotonic()
+        if delay > 0:
+            self.stats['backoff_seconds'] += delay
+            time.sleep(delay)
+
+        start = time.perf_counter()
+        future = self.session.execute_async(self.statement, values)
+        future.add_callbacks(self._on_success, self._on_error,
+                             callback_args=(start,), errback_args=(values, attempt))
+
+    def flush(self):
+        while True:
+            self._drain_retries()
+            with self.condition:
+                if self.in_flight == 0 and self.retry_queue.empty():
+                    break
+                self.condition.wait(timeout=0.1)
+
+        if self.errors:
+            raise RuntimeError(f"{len(self.errors)} rows could not be written, first error: {self.errors[0]}")
+
+    def _drain_retries(self):
+        while True:
+            try:
+                values, attempt = self.retry_queue.get_nowait()
+            except queue.Empty:
+                return
+            self.stats['retries'] += 1
+            self._send(values, attempt)
+
+    def _on_success(self, _result, start):
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        bucket = next(i for i, bound in enumerate(LATENCY_BUCKETS_MS) if elapsed_ms <= bound)
+
+        with self.condition:
+            self.stats['rows'] += 1
+            self.stats['latency_buckets'][bucket] += 1
+            self.limit = min(self.max_concurrency, self.limit + 1)
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def _on_error(self, exc, values, attempt):
+        with self.condition:
+            if isinstance(exc, self.RETRYABLE_ERRORS) and attempt < self.max_retries:
+                self.limit = max(1, self.limit // 2)
+                self.pause_until = max(self.pause_until,
+                                       time.monotonic() + self.backoff_seconds * (2 ** attempt))
+                self.retry_queue.put((values, attempt + 1))
+            else:
+                self.stats['failures'] += 1
+                self.errors.append(exc)
+                log_event(logging.WARNING, "Write failed", error=repr(exc), attempts=attempt + 1)
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+
+_executor_logging_configured = False
+
+
+def configure_executor_logging(sink_options):
+    # executors import this module without running main(), so set logging up once per python worker
+    global _executor_logging_configured
+
+    if not _executor_logging_configured:
+        configure_logging(sink_options['log_level'], sink_options['log_format'])
+        _executor_logging_configured = True
+
+
+def write_partition_to_cassandra(rows, table, columns, hosts, sink_options, stats_accumulator):
+    configure_executor_logging(sink_options)
+    partition_start = time.perf_counter()
+    session = get_executor_session(hosts, sink_options['executor_threads'])
+    statement = get_prepared_insert(session, table, columns)
+
+    writer = PartitionWriter(session, statement, sink_options['max_concurrency'],
+                             sink_options['max_retries'], sink_options['backoff_seconds'])
+    try:
+        for row in rows:
+            writer.submit(tuple(row))
+        writer.flush()
+    finally:
+        writer.stats['partitions'] = 1
+        writer.stats['max_partition_seconds'] = time.perf_counter() - partition_start
+        stats_accumulator.add(writer.stats)
+        log_sampled(logging.INFO, sink_options['log_sample_rate'], "Partition written", table=table,
+                    rows=writer.stats['rows'], retries=writer.stats['retries'],
+                    seconds=round(writer.stats['max_partition_seconds'], 3))
+
+
+_shipped_to_executors = False
+
+
+def ship_module_to_executors(spark_context):
+    global _shipped_to_executors
+
+    if not _shipped_to_executors:
+        spark_context.addPyFile(os.path.abspath(__file__))
+        spark_context.addPyFile(os.path.abspath(structured_logging.__file__))
+        _shipped_to_executors = True
+
+    return os.path.splitext(os.path.basename(__file__))[0]
+
+
+def write_to_cassandra_partitions(df, config, table='created_users'):
+    spark_context = df.sparkSession.sparkContext
+    stats_accumulator = spark_context.accumulator(empty_write_stats(), WriteStatsParam())
+    module_name = ship_module_to_executors(spark_context)
+
+    columns = df.columns
+    # executors import this module without running load_config, so pass plain values along
+    hosts = config.cassandra_hosts
+    sink_options = {
+        'max_concurrency': config.sink_max_concurrency,
+        'max_retries': config.sink_max_retries,
+        'backoff_seconds': config.sink_backoff_seconds,
+        'executor_threads': config.cassandra_executor_threads,
+        'log_level': config.log_level,
+        'log_format': config.log_format,
+        'log_sample_rate': config.log_sample_rate,
+    }
+    num_partitions = config.sink_partitions or spark_context.defaultParallelism
+    if df.rdd.getNumPartitions() < num_partitions:
+        df = df.repartition(num_partitions)
+
+    def write_partition(rows):
+        importlib.import_module(module_name).write_partition_to_cassandra(
+            rows, table, columns, hosts, sink_options, stats_accumulator)
+
+    df.foreachPartition(write_partition)
+
+    stats = stats_accumulator.value
+    log_event(logging.INFO, "Table written", table=table, rows=stats['rows'], partitions=stats['partitions'],
+              p50_ms=latency_percentile(stats, 50), p99_ms=latency_percentile(stats, 99),
+              retries=stats['retries'], failures=stats['failures'],
+              backoff_seconds=round(stats['backoff_seconds'], 2),
+              slowest_partition_seconds=round(stats['max_partition_seconds'], 2))
+    return stats['rows']
+
+
+def write_to_cassandra(df, config, table='created_users'):
+    # rows written, or None when the spark cassandra connector wrote them (it reports no count back)
+    if config.sink_mode == 'partition':
+        return write_to_cassandra_partitions(df, config, table)
+
+    df.write \
+        .format("org.apache.spark.sql.cassandra") \
+        .mode("append") \
+        .option('keyspace', 'spark_streams') \
+        .option('table', table) \
+        .save()
+
+
+SINKS = {}
+
+
+def register_sink(name):
+    def register(sink_function):
+        SINKS[name] = sink_function
+        return sink_function
+
+    return register
+
+
+@register_sink('cassandra')
+def cassandra_sink(valid_df, epoch_id, config):
+    main_df, side_df = apply_projection(drop_trace_columns(valid_df), config.projection)
+    rows = write_to_cassandra(main_df, config)
+    if side_df is not None:
+        write_to_cassandra(side_df, config, config.projection['side_table']['table'])
+
+    if rows is None:
+        # connector mode only: main_df comes from the persisted batch, so counting it does not re-read kafka
+        rows = main_df.count()
+    session = get_executor_session(config.cassandra_hosts, config.cassandra_executor_threads)
+    increment_row_count(session, 'created_users', rows)
+
+
+def aggregate_dimensions():
+    # dimensions counted by the aggregates sink, read back by the dashboard charts
+    return {
+        'gender': col('gender'),
+        'email_domain': element_at(split(col('email'), '@'), -1),
+        'registered_year': substring(col('registered_date'), 1, 4),
+    }
+
+
+@register_sink('aggregates')
+def aggregates_sink(valid_df, epoch_id, config):
+    # the grouped batch is tiny, so collect it and apply the counter updates from the driver
+    session = get_executor_session(config.cassandra_hosts, config.cassandra_executor_threads)
+
+    dimension_counts = []
+    for dimension, value in aggregate_dimensions().items():
+        for row in valid_df.groupBy(value.alias('value')).count().collect():
+            dimension_counts.append((row['count'], dimension, row['value'] or 'Unknown'))
+
+    minute_counts = []
+    minute_seconds = floor(unix_timestamp(col('kafka_timestamp')) / 60) * 60
+    for row in valid_df.groupBy(minute_seconds.alias('minute')).count().collect():
+        minute_counts.append((row['count'], row['minute'] // 86400, row['minute'] * 1000))
+
+    execute_concurrent_with_args(session, get_prepared(
+        session,
+        "UPDATE spark_streams.user_counts_by_dimension SET row_count = row_count + ? WHERE dimension = ? AND value = ?"
+    ), dimension_counts, raise_on_first_error=True)
+    execute_concurrent_with_args(session, get_prepared(
+        session,
+        "UPDATE spark_streams.ingest_counts_by_minute SET row_count = row_count + ? WHERE ingest_day = ? AND minute = ?"
+    ), minute_counts, raise_on_first_error=True)
+
+
+@register_sink('recent_users')
+def recent_users_sink(valid_df, epoch_id, config):
+    # bucket and timestamp as epoch numbers so neither depends on the spark or python worker time zone
+    recent_df = valid_df.select(
+        floor(unix_timestamp(col('kafka_timestamp')) / 3600).alias('ingest_hour'),
+        (col('kafka_timestamp').cast('double') * 1000).cast('long').alias('ingest_ts'),
+        'id', 'username', 'first_name', 'gender', 'email', 'registered_date'
+    )
+    write_to_cassandra(recent_df, config, 'recent_users_by_hour')
+
+
+@register_sink('search_index')
+def search_index_sink(valid_df, epoch_id, config):
+    # one users_by_prefix row per searchable field of every user
+    search_df = None
+    for search_field in SEARCH_FIELDS:
+        field_df = valid_df.where(col(search_field).isNotNull()).select(
+            lit(search_field).alias('field'),
+            substring(lower(col(search_field)), 1, SEARCH_BUCKET_LENGTH).alias('bucket'),
+            lower(col(search_field)).alias('value'),
+            'id', 'username', 'first_name', 'last_name', 'email'
+        )
+        search_df = field_df if search_df is None else search_df.unionByName(field_df)
+
+    write_to_cassandra(search_df, config, 'users_by_prefix')
+
+
+@register_sink('latency_traces')
+def latency_traces_sink(valid_df, epoch_id, config):
+    # list it last in `sinks` so the trace rows' write time comes after every other write of the batch
+    traces_df = valid_df.where(col('trace_id').isNotNull()).select(
+        'trace_id', 'id',
+        lit(epoch_id).cast('long').alias('batch_id'),
+        'fetch_started_at', 'fetched_at', 'produced_at',
+        (col('kafka_timestamp').cast('double') * 1000).cast('long').alias('kafka_ts'),
+        'batch_started_at', 'batch_processed_at'
+    )
+    write_to_cassandra(traces_df, config, 'pipeline_traces')
+
+
+def hadoop_path(spark, path, *children):
+    jvm_path = spark._jvm.org.apache.hadoop.fs.Path(path)
+    for child in children:
+        jvm_path = spark._jvm.org.apache.hadoop.fs.Path(jvm_path, child)
+    return jvm_path.getFileSystem(spark._jsc.hadoopConfiguration()), jvm_path
+
+
+# written next to a compaction's staged files once they are complete; its presence commits the swap
+COMPACTION_PLAN = '_PLAN.json'
+
+_parquet_compactions_recovered = False
+
+
+def read_compaction_plan(spark, fs, plan_path):
+    # None unless the plan parses and has the expected shape; the plan is renamed into place complete, so an
+    # unreadable one never had any of its steps applied
+    if not fs.exists(plan_path):
+        return None
+    row = spark.read.text(plan_path.toString(), wholetext=True).first()
+    try:
+        plan = json.loads(row[0] if row else '')
+        valid = all(isinstance(move, list) and len(move) == 2 and all(isinstance(path, str) for path in move)
+                    for move in plan['moves']) and all(isinstance(path, str) for path in plan['deletes'])
+    except (ValueError, TypeError, KeyError):
+        valid = False
+    if not valid:
+        log_event(logging.WARNING, "Unreadable parquet compaction plan ignored", plan=plan_path.toString())
+        return None
+    return plan
+
+
+def write_compaction_plan(spark, fs, staging, plan):
+    # written to a temporary name and renamed, so a crash never leaves a partial plan under COMPACTION_PLAN
+    tmp_path = hadoop_path(spark, staging, COMPACTION_PLAN + '.tmp')[1]
+    plan_stream = fs.create(tmp_path, True)
+    try:
+        plan_stream.write(bytearray(json.dumps(plan).encode('utf-8')))
+    finally:
+        plan_stream.close()
+    if not fs.rename(tmp_path, hadoop_path(spark, staging, COMPACTION_PLAN)[1]):
+        raise RuntimeError(f"Could not rename {tmp_path.toString()} to {COMPACTION_PLAN}")
+
+
+def finish_compaction(spark, staging):
+    # Applies a staged compaction: moves the merged files into the partition, then deletes the files they
+    # replace. Every step is idempotent, so a plan left behind by a failed run is simply applied again;
+    # staging without a (valid) plan is a rewrite that never completed and is dropped, the originals being
+    # intact.
+    fs, staging_path = hadoop_path(spark, staging)
+    plan = read_compaction_plan(spark, fs, hadoop_path(spark, staging, COMPACTION_PLAN)[1])
+    if plan is not None:
+        for source, target in plan['moves']:
+            source_path = hadoop_path(spark, source)[1]
+            if fs.exists(source_path):
+                fs.rename(source_path, hadoop_path(spark, target)[1])
+        for path in plan['deletes']:
+            fs.delete(hadoop_path(spark, path)[1], False)
+    fs.delete(staging_path, True)
+
+
+def recover_parquet_compactions(spark, config):
+    fs, staging_root = hadoop_path(spark, f"{config.parquet_path}_compaction")
+    if fs.exists(staging_root):
+        for status in fs.listStatus(staging_root):
+            finish_compaction(spark, status.getPath().toString())
+            log_event(logging.WARNING, "Interrupted parquet compaction finished",
+                      partition=status.getPath().getName())
+        fs.delete(staging_root, True)
+
+
+def compact_parquet_partitions(spark, config):
+    # Rewrites the small files of each ingest_date partition into a few large ones. It runs inside the
+    # parquet sink, between this job's own appends, so no write races it; a reader listing a partition
+    # while it is swapped may briefly see old and new files together, but never a gap.
+    recover_parquet_compactions(spark, config)
+    fs, root = hadoop_path(spark, config.parquet_path)
+    if not fs.exists(root):
+        return
+
+    target_bytes = config.parquet_target_file_mb * 1024 * 1024
+    for partition in fs.listStatus(root):
+        name = partition.getPath().getName()
+        if not partition.isDirectory() or not name.startswith('ingest_date='):
+            continue
+
+        # files already near the target size are left alone, so a partition is not rewritten over and over
+        small_files = [status for status in fs.listStatus(partition.getPath())
+                       if status.getPath().getName().endswith('.parquet') and status.getLen() < target_bytes // 2]
+        if len(small_files) < config.parquet_compaction_min_files:
+            continue
+
+        total_bytes = sum(status.getLen() for status in small_files)
+        num_files = math.ceil(total_bytes / target_bytes)
+        staging = f"{config.parquet_path}_compaction/{name}"
+        staged_data = f"{staging}/data"
+        spark.read.option('mergeSchema', 'true').parquet(*[status.getPath().toString() for status in small_files]) \
+            .drop('ingest_date') \
+            .coalesce(num_files) \
+            .write.mode('overwrite').parquet(staged_data)
+
+        staged_files = [status.getPath() for status in fs.listStatus(hadoop_path(spark, staged_data)[1])
+                        if status.getPath().getName().endswith('.parquet')]
+        plan = {
+            'moves': [[path.toString(), f"{partition.getPath().toString()}/compacted-{path.getName()}"]
+                      for path in staged_files],
+            'deletes': [status.getPath().toString() for status in small_files],
+        }
+        write_compaction_plan(spark, fs, staging, plan)
+        finish_compaction(spark, staging)
+
+        log_event(logging.INFO, "Parquet partition compacted", partition=name, files_before=len(small_files),
+                  files_after=len(staged_files), mb=round(total_bytes / 1024 / 1024, 1))
+
+
+def analytics_projection(projection):
+    # the table projection, except that the analytics copy keeps kafka_timestamp (the ingest time its charts
+    # and partitions use) and leaves text columns as text, since parquet dictionary-encodes them itself
+    return {
+        **projection,
+        'drop': [c for c in projection.get('drop', []) if c != 'kafka_timestamp'],
+        'dictionary_encode': {},
+    }
+
+
+@register_sink('parquet')
+def parquet_sink(valid_df, epoch_id, config):
+    # analytics copy for the dashboard: one file per ingest date and batch, merged by the periodic compaction
+    main_df, _ = apply_projection(drop_trace_columns(valid_df), analytics_projection(config.projection))
+    main_df.withColumn('ingest_date', to_date(col('kafka_timestamp'))) \
+        .repartition('ingest_date') \
+        .write \
+        .mode('append') \
+        .partitionBy('ingest_date') \
+        .parquet(config.parquet_path)
+
+    global _parquet_compactions_recovered
+    if not _parquet_compactions_recovered:
+        # a compaction interrupted by a crash would otherwise leave duplicate rows until the next one
+        recover_parquet_compactions(valid_df.sparkSession, config)
+        _parquet_compactions_recovered = True
+
+    if config.parquet_compaction_every and epoch_id > 0 and epoch_id % config.parquet_compaction_every == 0:
+        compact_parquet_partitions(valid_df.sparkSession, config)
+
+
+@register_sink('kafka_compacted')
+def kafka_compacted_sink(valid_df, epoch_id, config):
+    valid_df = drop_trace_columns(valid_df)
+    valid_df.select(col('id').alias('key'), to_json(struct(*valid_df.columns)).alias('value')) \
+        .write \
+        .format('kafka') \
+        .option('kafka.bootstrap.servers', config.kafka_bootstrap_servers) \
+        .option('topic', config.compacted_topic) \
+        .save()
+
+
+def foreach_batch_function(df, epoch_id, config):
+    # the batch is counted and fanned out to every sink, so read and parse it from kafka only once
+    batch_started_at = int(time.time() * 1000)
+    df.persist()
+    try:
+        valid_df, invalid_df = split_valid_invalid(df)
+        valid_count = valid_df.count()
+        invalid_count = invalid_df.count()
+
+        # driver-side stamps for latency tracing: batch handed to us, batch read and parsed (before the sinks;
+        # latency_report counts the sinks up to the trace row's write time as one stage)
+        valid_df = valid_df.withColumn('batch_started_at', lit(batch_started_at)) \
+            .withColumn('batch_processed_at', lit(int(time.time() * 1000)))
+
+        sink_seconds = {}
+        if valid_count > 0:
+            for sink_name in config.sinks:
+                sink_start = time.perf_counter()
+                SINKS[sink_name](valid_df, epoch_id, config)
+                sink_seconds[sink_name] = round(time.perf_counter() - sink_start, 3)
+
+        if invalid_count > 0:
+            write_to_dlq(invalid_df, epoch_id, config)
+
+        # one line per batch with everything that happened in it
+        log_event(logging.INFO, "Batch processed", batch_id=epoch_id, valid=valid_count, invalid=invalid_count,
+                  dlq_topic=config.dlq_topic if invalid_count else None, sink_seconds=sink_seconds,
+                  seconds=round(time.time() - batch_started_at / 1000, 3))
+    finally:
+        df.unpersist()
+
+
+def sync_created_users_columns(session, selection_df, config):
+    projected_df, _ = apply_projection(drop_trace_columns(split_valid_invalid(selection_df)[0]), config.projection)
+    sync_table_columns(session, 'created_users', projected_df.schema)
+
+
+def backfill_handoff_config(config, ending_timestamp):
+    # The stream starts exactly where the backfill ended: both ends are exclusive / inclusive views of the
+    # same offsets, so nothing is skipped or written twice. With the broker on LogAppendTime, records that
+    # arrive after the backfill read have timestamps at or after ending_timestamp and go to the stream.
+    if config.backfill_ending_offsets is not None:
+        return replace(config, starting_offsets=config.backfill_ending_offsets, starting_timestamp=None)
+    return replace(config, starting_timestamp=ending_timestamp)
+
+
+def checkpoint_has_offsets(checkpoint_location):
+    offsets_dir = os.path.join(checkpoint_location, 'offsets')
+    return os.path.isdir(offsets_dir) and bool(os.listdir(offsets_dir))
+
+
+def run_backfill(spark_conn, session, config, ending_timestamp):
+    # The range is written as one batch through the configured sinks, spread over backfill_partitions
+    # parallel writers. Counting sinks (aggregates, the row counters) add to what is already there, so
+    # rebuilding a table that the stream has filled should use --sinks cassandra,search_index.
+    num_partitions = config.backfill_partitions or 4 * spark_conn.sparkContext.defaultParallelism
+
+    kafka_df = read_kafka_range(spark_conn, config, ending_timestamp, num_partitions)
+    selection_df = create_selection_df_from_kafka(kafka_df, config.required_fields)
+    sync_created_users_columns(session, selection_df, config)
+
+    log_event(logging.INFO, "Backfill starting", topics=config.topics, partitions=num_partitions,
+              starting_offsets=config.backfill_starting_offsets, starting_timestamp=config.backfill_starting_timestamp,
+              ending_offsets=config.backfill_ending_offsets,
+              ending_timestamp=None if config.backfill_ending_offsets else ending_timestamp, sinks=config.sinks)
+    started = time.perf_counter()
+    foreach_batch_function(selection_df, BACKFILL_BATCH_ID, replace(config, sink_partitions=num_partitions))
+    log_event(logging.INFO, "Backfill finished", seconds=round(time.perf_counter() - started, 1))
+
+
+def main(argv=None):
+    config = load_config(argv)
+    configure_logging(config.log_level, config.log_format)
+
     # create spark connection
-    spark_conn = create_spark_connection()
+    spark_conn = create_spark_connection(config)
 
     if spark_conn is not None:
-        # connect to kafka with spark connection
-        spark_df = connect_to_kafka(spark_conn)
-        selection_df = create_selection_df_from_kafka(spark_df)
-        session = create_cassandra_connection()
+        session = create_cassandra_connection(config)
 
         if session is not None:
             create_keyspace(session)
             create_table(session)
+            create_side_table(session, config.projection)
+            create_counter_table(session)
+            create_recent_users_table(session)
+            create_aggregate_tables(session)
+            create_search_indexes(session)
+            create_trace_table(session)
+
+            if config.mode != 'stream':
+                ending_timestamp = config.backfill_ending_timestamp or int(time.time() * 1000)
+                if config.mode == 'backfill_then_stream' and checkpoint_has_offsets(config.checkpoint_location):
+                    log_event(logging.WARNING, "Checkpoint exists, the stream resumes from it instead of the "
+                                               "backfill's end", checkpoint_location=config.checkpoint_location)
+                run_backfill(spark_conn, session, config, ending_timestamp)
+                if config.mode == 'backfill':
+                    return
+                config = backfill_handoff_config(config, ending_timestamp)
+
+            # connect to kafka with spark connection
+            spark_df = connect_to_kafka(spark_conn, config)
+            selection_df = create_selection_df_from_kafka(spark_df, config.required_fields)
+            sync_created_users_columns(session, selection_df, config)
 
-            print("Streaming is being started...")
-            print("********************************************************")
+            log_event(logging.INFO, "Streaming query starting", sinks=config.sinks,
+                      checkpoint_location=config.checkpoint_location, trigger_interval=config.trigger_interval)
 
-            streaming_query = (selection_df.writeStream.foreachBatch(foreach_batch_function)
-                               .outputMode("append")
-                               .format("org.apache.spark.sql.cassandra")
-                               .option('checkpointLocation', '/tmp/checkpoint')
-                               .option('keyspace', 'spark_streams')
-                               .option('table', 'created_users')
-                               .start())
+            writer = (selection_df.writeStream
+                      .foreachBatch(functools.partial(foreach_batch_function, config=config))
+                      .outputMode("append")
+                      .option('checkpointLocation', config.checkpoint_location))
 
+            if config.trigger_interval:
+                writer = writer.trigger(processingTime=config.trigger_interval)
+
+            streaming_query = writer.start()
             streaming_query.awaitTermination()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,15 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from cassandra.cluster import Cluster
+import plotly.io as pio
+from cassandra_client import CassandraClient, COUNT_STRATEGIES, count_exact, count_from_size_estimates, read_token_ranges, \
+    latest_ingest_ts, fetch_recent_since, utc_now, search_users, SearchTermError, RECENT_OVERLAP
+from chart_data import dimension_counts, ingest_series, downsample
+import analytics_store
+from kafka_live import LiveUserFeed
+from log_tail import LogTailService, LEVELS
 from PIL import Image
 import time
-import subprocess
 import os
 import datetime
 
@@ -109,36 +114,373 @@ st.markdown("""
 
 # ------------------ FUNCTIONS ------------------
 
+# columns read by the demo tab; 'picture' stays out of every dashboard read
+DASHBOARD_COLUMNS = ['username', 'first_name', 'gender', 'email', 'registered_date']
+USER_COLUMNS = ['id', 'username', 'first_name', 'last_name', 'gender', 'email', 'registered_date', 'phone']
+
+# token-range reader tuning: ranges per read, ranges read at once, rows per page
+READ_SPLITS = 16
+READ_CONCURRENCY = 8
+READ_FETCH_SIZE = 1000
+
+# push-based live mode: tails the topic directly and redraws from memory
+KAFKA_BOOTSTRAP_SERVERS = ['localhost:9092']
+KAFKA_LIVE_REFRESH_SECONDS = 1
+
+# pre-aggregated charts: counters kept by the spark aggregates sink, time series downsampled to about
+# the pixel width of a full-width chart, figure JSON cached per (chart, window, refresh tick)
+PRE_AGGREGATED = "Pre-aggregated (Cassandra)"
+SAMPLE_ROWS = "Sample rows"
+CHART_MAX_POINTS = 800
+CHART_CACHE_SECONDS = 30
+TIMELINE_WINDOWS = {"Last hour": 60, "Last 6 hours": 360, "Last 24 hours": 1440, "Last 7 days": 10080}
+# the same charts from the parquet sink's analytics copy, optionally limited to recently ingested rows
+PARQUET_ANALYTICS = "Analytics copy (Parquet)"
+ANALYTICS_PERIODS = {"All time": None, "Last 7 days": 7, "Last 30 days": 30, "Last 365 days": 365}
+TABLE_ROWS = 20
+
+# search panel: label -> searchable column (SAI index / users_by_prefix field)
+SEARCH_FIELDS = {"Email": 'email', "Username": 'username', "Last name": 'last_name'}
+SEARCH_PAGE_SIZES = [10, 25, 50, 100]
+
+# log tailing: container name and the bundled capture followed when docker is not reachable
+LOG_SOURCES = {
+    "Spark Master": ("airflow-kafka-spark-cassandra-streaming-spark-master-1", "spark_master_logs.txt"),
+    "Airflow Scheduler": ("airflow-kafka-spark-cassandra-streaming-scheduler-1", "airflow_scheduler_logs.txt"),
+    "Kafka Broker": ("broker", "kafka_broker_logs.txt"),
+    "Cassandra": ("cassandra", "cassandra_logs.txt"),
+}
+LOG_BUFFER_LINES = 2000
+LOG_VIEW_LINES = 500
+LOG_REFRESH_SECONDS = 2
+
+# newest rows kept in the live-update buffer for the metrics and the latest registrations table
+LIVE_BUFFER_ROWS = 500
+
+@st.cache_resource
+def get_cassandra_client():
+    # one cluster/session per server process instead of a new one on every rerun
+    return CassandraClient(['localhost'], port=9042)
+
 def get_cassandra_session():
-    try:
-        cluster = Cluster(['localhost'], port=9042)
-        session = cluster.connect()
-        return session
-    except Exception as e:
-        return None
+    return get_cassandra_client().ensure_connected()
+
+@st.cache_data(ttl=60, show_spinner="Counting rows across token ranges...")
+def get_exact_count():
+    # a full (if parallel) scan, so only rerun it once a minute
+    return count_exact(get_cassandra_client())
 
-def get_data(session):
+def get_total_count(client, strategy):
+    if strategy == 'Exact (token ranges)':
+        return get_exact_count()
+
+    count = COUNT_STRATEGIES[strategy](client)
+    if count is None and strategy == 'Counter table':
+        # counter table not populated yet (spark job not started with the counter sink)
+        count = count_from_size_estimates(client)
+    return count
+
+def get_data(client, count_strategy='Counter table'):
     try:
         # Fetch total count
-        count_row = session.execute("SELECT count(*) FROM spark_streams.created_users").one()
-        count = count_row[0]
+        count = get_total_count(client, count_strategy) or 0
         
         # Fetch recent data for table
-        rows = session.execute("SELECT * FROM spark_streams.created_users LIMIT 100")
-        df = pd.DataFrame(list(rows))
+        df = read_token_ranges(client, USER_COLUMNS, limit=100, fetch_size=READ_FETCH_SIZE)
         return count, df
     except Exception as e:
         return 0, pd.DataFrame()
 
-def get_docker_logs(container_name, lines=50):
+def style_figure(fig, **layout):
+    fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)',
+                      font_color='white', margin=dict(t=0, b=0, l=0, r=0), **layout)
+    return fig
+
+def gender_figure(counts):
+    gender_counts = counts.rename_axis('gender').reset_index(name='count')
+    fig = px.pie(gender_counts, values='count', names='gender',
+                 color_discrete_sequence=['#00d4ff', '#00ff88', '#ff6b6b'],
+                 hole=0.4)
+    return style_figure(fig)
+
+def email_figure(counts):
+    email_counts = counts.nlargest(5).rename_axis('domain').reset_index(name='count')
+    fig = px.bar(email_counts, x='domain', y='count', color='count',
+                 color_continuous_scale=['#00d4ff', '#00ff88'])
+    return style_figure(fig, xaxis=dict(showgrid=False), yaxis=dict(showgrid=True, gridcolor='rgba(255,255,255,0.1)'))
+
+def year_figure(counts):
+    # OPTIMIZED: Group by Year to avoid creating millions of points for 20-year spans
+    df_trend = counts.sort_index().rename_axis('year').reset_index(name='count')
+    fig = px.area(df_trend, x='year', y='count',
+                  markers=True, line_shape='spline')
+    fig.update_traces(line_color='#00d4ff', fillcolor='rgba(0, 212, 255, 0.2)')
+    return style_figure(fig, hovermode="x unified",
+                        xaxis=dict(showgrid=False, title='Year'),
+                        yaxis=dict(showgrid=True, gridcolor='rgba(255,255,255,0.1)', title='Registrations'))
+
+def ingest_figure(series):
+    df_rate = series.rename_axis('minute').reset_index(name='count')
+    fig = px.line(df_rate, x='minute', y='count')
+    fig.update_traces(line_color='#00ff88')
+    return style_figure(fig, hovermode="x unified",
+                        xaxis=dict(showgrid=False, title=''),
+                        yaxis=dict(showgrid=True, gridcolor='rgba(255,255,255,0.1)', title='Records / minute'))
+
+@st.cache_data(ttl=600, max_entries=64, show_spinner=False)
+def get_chart_json(chart, window_minutes, refresh_key, source=PRE_AGGREGATED, period_days=None):
+    # refresh_key only partitions the cache; every (chart, window, tick) is built once and shared by all sessions
+    if source == PARQUET_ANALYTICS:
+        return get_analytics_chart(chart, window_minutes, period_days).to_json()
+
+    client = get_cassandra_client()
+    if chart == 'gender':
+        fig = gender_figure(dimension_counts(client, 'gender'))
+    elif chart == 'email_domain':
+        fig = email_figure(dimension_counts(client, 'email_domain'))
+    elif chart == 'registered_year':
+        counts = dimension_counts(client, 'registered_year')
+        counts.index = pd.to_numeric(counts.index, errors='coerce')
+        fig = year_figure(counts[counts.index.notna()])
+    else:
+        fig = ingest_figure(downsample(ingest_series(client, window_minutes), CHART_MAX_POINTS))
+    return fig.to_json()
+
+def get_analytics_chart(chart, window_minutes, period_days):
+    if chart == 'ingest':
+        return ingest_figure(downsample(analytics_store.ingest_series(window_minutes), CHART_MAX_POINTS))
+
+    counts = analytics_store.dimension_counts(chart, period_days)
+    if chart == 'gender':
+        return gender_figure(counts)
+    if chart == 'email_domain':
+        return email_figure(counts)
+    counts.index = pd.to_numeric(counts.index, errors='coerce')
+    return year_figure(counts[counts.index.notna()])
+
+# chart -> (aggregates key, figure builder) for the charts drawn from sampled rows
+SAMPLE_CHARTS = {'gender': ('gender', gender_figure), 'email_domain': ('email_domain', email_figure),
+                 'registered_year': ('year', year_figure)}
+
+def sample_chart(chart, aggregates):
+    key, build = SAMPLE_CHARTS.get(chart, (None, None))
+    if key in aggregates:
+        st.plotly_chart(build(aggregates[key]), use_container_width=True)
+
+def show_chart(chart, window_minutes, refresh_key, source=PRE_AGGREGATED, period_days=None, aggregates=None):
+    # the counter tables only exist once the spark job has run the aggregates sink, and the analytics copy
+    # once it has run the parquet sink; until then the chart falls back to the sampled rows
+    try:
+        fig = pio.from_json(get_chart_json(chart, window_minutes, refresh_key, source, period_days))
+    except Exception as e:
+        st.warning(f"{source} data is not available ({e}); showing the sampled rows instead.")
+        sample_chart(chart, aggregates or {})
+        return
+    st.plotly_chart(fig, use_container_width=True)
+
+@st.cache_resource
+def get_live_feed():
+    # one consumer thread per server process, shared by every session
+    return LiveUserFeed(KAFKA_BOOTSTRAP_SERVERS, topic='users_data', buffer_size=LIVE_BUFFER_ROWS).start()
+
+def render_kafka_live(feed):
+    snapshot = feed.snapshot()
+    if snapshot['error']:
+        st.error(f"Kafka consumer error: {snapshot['error']}")
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Records Seen (this server)", f"{snapshot['total']:,}", delta="Kafka")
+    with col2:
+        last_user = snapshot['recent'][0]['username'] if snapshot['recent'] else "N/A"
+        st.metric("Latest User", last_user)
+    with col3:
+        st.metric("Throughput", f"{snapshot['rate']:.2f} rec/s", delta=f"{snapshot['invalid']} invalid")
+
+    st.markdown("---")
+
+    if not snapshot['recent']:
+        st.warning("Listening on users_data... Please start the Airflow DAG.")
+        return
+
+    c1, c2 = st.columns(2)
+    with c1:
+        st.markdown("### 🌍 Gender Distribution")
+        st.plotly_chart(gender_figure(pd.Series(snapshot['gender_counts'], dtype='int64')), use_container_width=True)
+
+    with c2:
+        st.markdown("### ⚡ Records per Second")
+        rate_df = pd.DataFrame(snapshot['per_second'], columns=['second', 'count'])
+        rate_df['second'] = pd.to_datetime(rate_df['second'], unit='s')
+        fig = px.bar(rate_df, x='second', y='count')
+        fig.update_traces(marker_color='#00d4ff')
+        style_figure(fig, xaxis=dict(showgrid=False, title=''), yaxis=dict(showgrid=True, gridcolor='rgba(255,255,255,0.1)'))
+        st.plotly_chart(fig, use_container_width=True)
+
+    st.markdown("### 📧 Top Email Providers")
+    st.plotly_chart(email_figure(pd.Series(snapshot['domain_counts'], dtype='int64')), use_container_width=True)
+
+    st.markdown("### 📋 Latest Registrations (from Kafka)")
+    st.dataframe(pd.DataFrame(snapshot['recent'][:20]), hide_index=True, use_container_width=True)
+
+if hasattr(st, 'fragment'):
+    # redraw only this part of the page from the in-memory snapshot
+    render_kafka_live = st.fragment(run_every=KAFKA_LIVE_REFRESH_SECONDS)(render_kafka_live)
+
+def value_counts(series):
+    # plain (non-categorical) index so counts from different loads can be added together
+    counts = series.value_counts()
+    counts = counts[counts > 0]
+    counts.index = counts.index.astype(object)
+    return counts
+
+def compute_aggregates(df):
+    aggregates = {}
+    if 'gender' in df.columns:
+        aggregates['gender'] = value_counts(df['gender'])
+    if 'email_domain' in df.columns:
+        aggregates['email_domain'] = value_counts(df['email_domain'])
+    if 'registered_date' in df.columns:
+        aggregates['year'] = value_counts(df['registered_date'].dt.year)
+    return aggregates
+
+def merge_aggregates(current, delta):
+    merged = dict(current)
+    for key, counts in delta.items():
+        merged[key] = current[key].add(counts, fill_value=0).astype('int64') if key in current else counts
+    return merged
+
+def recent_ids(df, watermark):
+    # ids of the rows inside the overlap window behind the watermark, which the next tick reads again
+    if df.empty:
+        return {}
+    recent = df[df['ingest_ts'] > watermark - RECENT_OVERLAP]
+    return dict(zip(recent['id'], recent['ingest_ts']))
+
+def load_live_state(client, sample_size):
+    # initial sample plus the watermark that later ticks fetch from
+    df = read_token_ranges(client, DASHBOARD_COLUMNS, limit=sample_size,
+                           splits=READ_SPLITS, concurrency=READ_CONCURRENCY, fetch_size=READ_FETCH_SIZE)
+    watermark = latest_ingest_ts(client) or utc_now()
+    # rows up to the watermark count as seen, so the first tick's overlap does not add them again
+    window = fetch_recent_since(client, watermark)
+    if not window.empty:
+        window = window[window['ingest_ts'] <= watermark]
+    return {
+        'sample_size': sample_size,
+        'buffer': df.head(LIVE_BUFFER_ROWS),
+        'aggregates': compute_aggregates(df),
+        'rows_seen': len(df),
+        'watermark': watermark,
+        'recent_ids': recent_ids(window, watermark),
+        'last_delta': 0,
+    }
+
+def refresh_live_state(client, state):
+    # rows newer than the watermark, plus late rows inside the overlap window behind it that have not been
+    # seen yet, are fetched and folded into the running aggregates
+    delta = fetch_recent_since(client, state['watermark'], state.get('recent_ids', {}))
+    state['last_delta'] = len(delta)
+    if delta.empty:
+        return state
+
+    state['watermark'] = max(state['watermark'], delta['ingest_ts'].max().to_pydatetime())
+    seen = {id_: ts for id_, ts in state.get('recent_ids', {}).items()
+            if ts > state['watermark'] - RECENT_OVERLAP}
+    state['recent_ids'] = {**seen, **recent_ids(delta, state['watermark'])}
+    delta = delta.sort_values('ingest_ts', ascending=False).drop(columns='ingest_ts')
+    state['aggregates'] = merge_aggregates(state['aggregates'], compute_aggregates(delta))
+    state['buffer'] = pd.concat([delta, state['buffer']], ignore_index=True).head(LIVE_BUFFER_ROWS)
+    state['rows_seen'] += len(delta)
+    return state
+
+def render_search_panel(client):
+    st.markdown("### 🔎 Search Users")
+    c1, c2, c3, c4 = st.columns([2, 2, 4, 1])
+    with c1:
+        field_label = st.selectbox("Field", list(SEARCH_FIELDS), key="search_field")
+    with c2:
+        mode = st.radio("Match", ["prefix", "exact"], horizontal=True, key="search_mode")
+    with c3:
+        term = st.text_input("Search", key="search_term", placeholder="e.g. john or john.doe@example.com").strip()
+    with c4:
+        page_size = st.selectbox("Rows", SEARCH_PAGE_SIZES, index=1, key="search_page_size")
+
+    if not term:
+        return
+
+    # paging states of every page visited so far, so the user can go back as well as forward
+    query = (SEARCH_FIELDS[field_label], mode, term, page_size)
+    search = st.session_state.get('search')
+    if search is None or search['query'] != query:
+        search = {'query': query, 'paging_states': [None], 'page': 0}
+        st.session_state['search'] = search
+
     try:
-        result = subprocess.run(
-            ["docker", "logs", "--tail", str(lines), container_name],
-            capture_output=True, text=True, encoding='utf-8', errors='ignore'
-        )
-        return result.stdout + result.stderr
+        results, next_state = search_users(client, SEARCH_FIELDS[field_label], term, mode, page_size,
+                                           search['paging_states'][search['page']])
+    except SearchTermError as e:
+        st.info(str(e))
+        return
     except Exception as e:
-        return f"Error fetching logs: {e}"
+        st.error(f"Search failed: {e}")
+        return
+
+    if results.empty:
+        st.info("No matching users.")
+    else:
+        st.dataframe(results, hide_index=True, use_container_width=True)
+
+    col_prev, col_page, col_next = st.columns([1, 4, 1])
+    with col_prev:
+        if st.button("◀ Previous", disabled=search['page'] == 0, key="search_prev"):
+            search['page'] -= 1
+            st.rerun()
+    with col_page:
+        st.caption(f"Page {search['page'] + 1}")
+    with col_next:
+        if st.button("Next ▶", disabled=next_state is None, key="search_next"):
+            del search['paging_states'][search['page'] + 1:]
+            search['paging_states'].append(next_state)
+            search['page'] += 1
+            st.rerun()
+
+@st.cache_resource
+def get_log_service():
+    # one follower thread per container for the whole server process
+    return LogTailService(LOG_SOURCES, buffer_size=LOG_BUFFER_LINES).start()
+
+def render_logs(name, levels):
+    # each session keeps its own cursor and only pulls the lines added since the last render
+    tail = get_log_service().get(name)
+    view_key = f"log_view_{name}"
+    view = st.session_state.get(view_key)
+    if view is None or view['levels'] != levels:
+        view = {'levels': levels, 'cursor': 0, 'lines': []}
+
+    new_lines, view['cursor'] = tail.read(view['cursor'], set(levels))
+    view['lines'] = (view['lines'] + new_lines)[-LOG_VIEW_LINES:]
+    st.session_state[view_key] = view
+
+    status = tail.status()
+    if status['error'] and status['source'] != 'docker':
+        st.caption(f"⚠️ {status['error']}")
+    source = "docker logs" if status['source'] == 'docker' else "bundled log file"
+    st.caption(f"Source: {source} | {len(view['lines'])} lines shown | {status['buffered']} buffered")
+
+    logs = "\n".join(view['lines'])
+    st.download_button(
+        label="📥 Download Logs",
+        data=logs,
+        file_name=f"{name.replace(' ', '_').lower()}_logs.txt",
+        mime="text/plain"
+    )
+    st.code(logs, language="bash", line_numbers=True)
+
+render_logs_live = render_logs
+if hasattr(st, 'fragment'):
+    # poll the ring buffer without rerunning the rest of the page
+    render_logs_live = st.fragment(run_every=LOG_REFRESH_SECONDS)(render_logs)
 
 # ------------------ SIDEBAR ------------------
 
@@ -148,12 +490,44 @@ with st.sidebar:
     st.markdown("---")
     
     # Connection Status
+    client = get_cassandra_client()
     session = get_cassandra_session()
     if session:
         st.markdown('<div class="metric-card"><span class="live-dot"></span><strong>SYSTEM ONLINE</strong><br><small>Connected to Cassandra</small></div>', unsafe_allow_html=True)
     else:
         st.error("🔴 System Offline: Check Containers")
     
+    st.markdown("### 📥 Sample Size")
+    sample_size = st.select_slider("Rows to analyse", options=[500, 2000, 10000, 50000], value=2000)
+
+    st.markdown("### 📈 Charts")
+    chart_source = st.radio("Chart data", [PRE_AGGREGATED, PARQUET_ANALYTICS, SAMPLE_ROWS], horizontal=True,
+                            help="Pre-aggregated: counters kept by the Spark job, covering every record. "
+                                 "Analytics copy: group-bys over the Parquet files written by the Spark "
+                                 "job's parquet sink. Sample rows: aggregates computed from the sampled rows.")
+    analytics_period = None
+    if chart_source == PARQUET_ANALYTICS:
+        if analytics_store.has_data():
+            analytics_period = ANALYTICS_PERIODS[st.selectbox("Ingested in", list(ANALYTICS_PERIODS))]
+        else:
+            st.warning(f"No analytics copy in {analytics_store.DEFAULT_PATH} yet: add parquet to the Spark "
+                       f"job's sinks. Showing the Cassandra counters instead.")
+            chart_source = PRE_AGGREGATED
+    timeline_window = TIMELINE_WINDOWS[st.selectbox("Ingest timeline window", list(TIMELINE_WINDOWS))]
+
+    st.markdown("### 🔢 Record Count")
+    count_strategy = st.selectbox(
+        "Count strategy",
+        list(COUNT_STRATEGIES),
+        help="Counter table: one partition read of the count kept by the Spark job. "
+             "Size estimates: Cassandra's own estimate. "
+             "Exact: parallel count over token ranges, refreshed at most once a minute."
+    )
+
+    st.markdown("### 📡 Data Source")
+    kafka_live = st.toggle("Live from Kafka (no Cassandra reads)", value=False,
+                           help="Tail users_data directly in a background consumer shared by all sessions.")
+
     st.markdown("### 🔄 Auto-Refresh")
     auto_refresh = st.toggle("Enable Live Updates", value=False)
     if auto_refresh:
@@ -193,23 +567,43 @@ tab1, tab2, tab3, tab4 = st.tabs([
 
 # ==================== TAB 1: PROJECT DEMO ====================
 with tab1:
-    if session:
+    if kafka_live:
+        render_kafka_live(get_live_feed())
+    elif session:
         # Fetch more data for better analysis
         # OPTIMIZED: Select ONLY necessary columns to avoid MessageSizeError (skipping 'picture' which is heavy)
         try:
-            query = "SELECT username, first_name, gender, email, registered_date FROM spark_streams.created_users LIMIT 2000"
-            rows = session.execute(query)
-            df = pd.DataFrame(list(rows))
-            count = len(df) 
+            if auto_refresh:
+                # live updates: keep a session buffer and fetch only rows newer than the last one seen
+                live_state = st.session_state.get('live_state')
+                if live_state is None or live_state['sample_size'] != sample_size:
+                    live_state = load_live_state(client, sample_size)
+                else:
+                    live_state = refresh_live_state(client, live_state)
+                st.session_state['live_state'] = live_state
+
+                df = live_state['buffer']
+                aggregates = live_state['aggregates']
+                count = live_state['rows_seen']
+            else:
+                st.session_state.pop('live_state', None)
+                # pre-aggregated charts only need enough rows for the table
+                row_limit = sample_size if chart_source == SAMPLE_ROWS else TABLE_ROWS
+                df = read_token_ranges(client, DASHBOARD_COLUMNS, limit=row_limit,
+                                       splits=READ_SPLITS, concurrency=READ_CONCURRENCY, fetch_size=READ_FETCH_SIZE)
+                aggregates = compute_aggregates(df)
+                count = len(df)
         except Exception as e:
             st.error(f"Error fetching data: {e}")
             count = 0
             df = pd.DataFrame()
+            aggregates = {}
 
-        # Get total count separately for accuracy
+        # Get total count from the selected strategy instead of a full-table count(*)
         try:
-            count_row = session.execute("SELECT count(*) FROM spark_streams.created_users").one()
-            total_count = count_row[0]
+            total_count = get_total_count(client, count_strategy)
+            if total_count is None:
+                total_count = count
         except:
             total_count = count
 
@@ -221,74 +615,61 @@ with tab1:
             last_user = df.iloc[0]['username'] if not df.empty else "N/A"
             st.metric("Latest User", last_user)
         with col3:
-            # Simple throughput estimate (records in last minute if we had timestamps, otherwise placeholder)
-            st.metric("System Status", "🟢 Active", delta="Streaming")
+            if auto_refresh and 'live_state' in st.session_state:
+                st.metric("System Status", "🟢 Active", delta=f"+{st.session_state['live_state']['last_delta']} new rows")
+            else:
+                st.metric("System Status", "🟢 Active", delta="Streaming")
 
         st.markdown("---")
 
         # --- Visualizations ---
         if not df.empty:
-            # Data Preprocessing
-            if 'registered_date' in df.columns:
-                df['registered_date'] = pd.to_datetime(df['registered_date'])
-            
-            if 'email' in df.columns:
-                df['email_domain'] = df['email'].apply(lambda x: x.split('@')[-1] if isinstance(x, str) else "Unknown")
+            # pre-aggregated charts come from cassandra counters or the parquet copy via the figure cache; sample
+            # charts are drawn from the aggregates, which live mode updates incrementally
+            refresh_key = int(time.time() // (refresh_rate if auto_refresh else CHART_CACHE_SECONDS))
+            use_pre_aggregated = chart_source != SAMPLE_ROWS
 
             # Row 1: Charts
             c1, c2 = st.columns(2)
             
             with c1:
                 st.markdown("### 🌍 Gender Distribution")
-                if 'gender' in df.columns:
-                    gender_counts = df['gender'].value_counts().reset_index()
-                    gender_counts.columns = ['gender', 'count']
-                    fig = px.pie(gender_counts, values='count', names='gender', 
-                                 color_discrete_sequence=['#00d4ff', '#00ff88', '#ff6b6b'],
-                                 hole=0.4)
-                    fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', 
-                                      font_color='white', margin=dict(t=0, b=0, l=0, r=0))
-                    st.plotly_chart(fig, use_container_width=True)
+                if use_pre_aggregated:
+                    show_chart('gender', None, refresh_key, chart_source, analytics_period, aggregates)
+                else:
+                    sample_chart('gender', aggregates)
             
             with c2:
                 st.markdown("### 📧 Top Email Providers")
-                if 'email_domain' in df.columns:
-                    email_counts = df['email_domain'].value_counts().head(5).reset_index()
-                    email_counts.columns = ['domain', 'count']
-                    fig = px.bar(email_counts, x='domain', y='count', color='count',
-                                 color_continuous_scale=['#00d4ff', '#00ff88'])
-                    fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', 
-                                      font_color='white', margin=dict(t=0, b=0, l=0, r=0),
-                                      xaxis=dict(showgrid=False), yaxis=dict(showgrid=True, gridcolor='rgba(255,255,255,0.1)'))
-                    st.plotly_chart(fig, use_container_width=True)
+                if use_pre_aggregated:
+                    show_chart('email_domain', None, refresh_key, chart_source, analytics_period, aggregates)
+                else:
+                    sample_chart('email_domain', aggregates)
 
             # Row 2: Timeline & Table
             st.markdown("---")
             
-            if 'registered_date' in df.columns:
-                st.markdown("### 📈 User Registration Timeline (By Year)")
-                
-                # OPTIMIZED: Group by Year to avoid creating millions of points for 20-year spans
-                df['year'] = df['registered_date'].dt.year
-                df_trend = df.groupby('year').size().reset_index(name='count')
-                
-                fig = px.area(df_trend, x='year', y='count', 
-                              markers=True, line_shape='spline')
-                fig.update_traces(line_color='#00d4ff', fillcolor='rgba(0, 212, 255, 0.2)')
-                fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', 
-                                  font_color='white', hovermode="x unified",
-                                  xaxis=dict(showgrid=False, title='Year'), 
-                                  yaxis=dict(showgrid=True, gridcolor='rgba(255,255,255,0.1)', title='Registrations'))
-                st.plotly_chart(fig, use_container_width=True)
+            st.markdown("### 📈 User Registration Timeline (By Year)")
+            if use_pre_aggregated:
+                show_chart('registered_year', None, refresh_key, chart_source, analytics_period, aggregates)
+            else:
+                sample_chart('registered_year', aggregates)
+
+            if use_pre_aggregated:
+                st.markdown("### ⏱️ Ingest Rate")
+                show_chart('ingest', timeline_window, refresh_key, chart_source, analytics_period)
 
             st.markdown("### 📋 Latest Registrations Table")
             cols_to_show = ['username', 'first_name', 'gender', 'email', 'registered_date']
             valid_cols = [c for c in cols_to_show if c in df.columns]
-            st.dataframe(df[valid_cols].head(20), hide_index=True, use_container_width=True)
+            st.dataframe(df[valid_cols].head(TABLE_ROWS), hide_index=True, use_container_width=True)
 
         else:
             st.warning("Waiting for data stream... Please start the Airflow DAG.")
 
+        st.markdown("---")
+        render_search_panel(client)
+
 # ==================== TAB 2: ABOUT THE PROJECT ====================
 with tab2:
     st.markdown("## 📚 Comprehensive Project Documentation")
@@ -492,37 +873,23 @@ with tab4:
     # Horizontal Radio Selection
     log_selection = st.radio(
         "Select Service Log:",
-        ["Spark Master", "Airflow Scheduler", "Kafka Broker", "Cassandra"],
+        list(LOG_SOURCES),
         horizontal=True,
         label_visibility="collapsed"
     )
     
-    container_map = {
-        "Spark Master": "airflow-kafka-spark-cassandra-streaming-spark-master-1",
-        "Airflow Scheduler": "airflow-kafka-spark-cassandra-streaming-scheduler-1",
-        "Kafka Broker": "broker",
-        "Cassandra": "cassandra"
-    }
-    
-    selected_container = container_map.get(log_selection)
-    
-    if selected_container:
-        st.markdown(f"### 🖥️ {log_selection} Logs")
-        logs = get_docker_logs(selected_container, lines=100)
-        
-        col_buttons = st.columns([1, 4])
-        with col_buttons[0]:
-            if st.button("🔄 Refresh Logs", key="refresh_logs"):
-                st.rerun()
-        with col_buttons[1]:
-            st.download_button(
-                label="📥 Download Logs",
-                data=logs,
-                file_name=f"{log_selection.replace(' ', '_').lower()}_logs.txt",
-                mime="text/plain"
-            )
-        
-        st.code(logs, language="bash", line_numbers=True)
+    st.markdown(f"### 🖥️ {log_selection} Logs")
+    col_filters = st.columns([4, 1])
+    with col_filters[0]:
+        # filter kept per container
+        log_levels = st.multiselect("Levels", LEVELS, default=LEVELS, key=f"log_levels_{log_selection}")
+    with col_filters[1]:
+        follow_logs = st.toggle("Follow", value=True, key="follow_logs")
+
+    if follow_logs:
+        render_logs_live(log_selection, log_levels)
+    else:
+        render_logs(log_selection, log_levels)
 
 # Footer
 st.markdown("---")
@@ -538,7 +905,7 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
-# Global Auto-Refresh Logic
-if auto_refresh:
+# Global Auto-Refresh Logic (the Kafka live view refreshes itself as a fragment)
+if auto_refresh and not (kafka_live and hasattr(st, 'fragment')):
     time.sleep(refresh_rate)
     st.rerun()
@@ -0,0 +1,47 @@
+import os
+import sys
+
+import pytest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [PROJECT_DIR]
+
+from restore_backup import split_address
+
+# spark_stream.split_address and its python twin in restore_backup must agree, including on addresses with
+# fewer parts than format_data builds
+
+ADDRESSES = [
+    '12 Main Street, Springfield, Oregon, United States',
+    '4, Rue de la Paix, Paris, Ile-de-France, France',
+    'Oregon, United States',
+    'United States',
+]
+
+
+def test_split_address_short_addresses():
+    assert split_address('United States') == {'country': 'United States', 'state': None, 'city': None, 'street': ''}
+    assert split_address('Oregon, United States') == {'country': 'United States', 'state': 'Oregon', 'city': None,
+                                                      'street': ''}
+    assert split_address(ADDRESSES[1])['street'] == '4, Rue de la Paix'
+
+
+@pytest.fixture(scope='module')
+def spark():
+    pytest.importorskip('pyspark')
+    from pyspark.sql import SparkSession
+
+    session = SparkSession.builder.master('local[1]').appName('test_split_address').getOrCreate()
+    yield session
+    session.stop()
+
+
+def test_spark_split_address_matches_python(spark):
+    import spark_stream
+
+    df = spark_stream.split_address(spark.createDataFrame([(address,) for address in ADDRESSES], ['address']))
+    rows = {row['address']: row.asDict() for row in df.collect()}
+
+    for address in ADDRESSES:
+        expected = split_address(address)
+        assert {key: rows[address][key] for key in expected} == expected
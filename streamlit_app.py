@@ -6,7 +6,7 @@ from PIL import Image
 import time
 import os
 import datetime
-import random
+import numpy as np
 
 # Page Configuration
 st.set_page_config(
@@ -112,35 +112,109 @@ def get_cassandra_session():
     # Simulate meaningful connection check
     return True
 
-def get_data(session):
-    # GENERATE FAKE DATA FOR DEMO
-    users = []
-    base_time = datetime.datetime.now()
-    
-    # Generate 50 items
+# synthetic users: distributions taken from the cassandra backup when it is available
+SAMPLE_DATA_PATHS = ["cassandra_backup_data.csv", "airflow-kafka-spark-cassandra-streaming/cassandra_backup_data.csv",
+                     "../airflow-kafka-spark-cassandra-streaming/cassandra_backup_data.csv"]
+DEMO_SEED = 42
+DEMO_SAMPLE_SIZES = [50, 1000, 10000, 100000, 1000000]
+DEMO_BASE_COUNT = 5432
+DEMO_RECORDS_PER_SECOND = 2.5
+DEMO_HISTORY_YEARS = 20
+# randomuser.me only hands out example.com addresses, so the domains are made up
+DEMO_EMAIL_DOMAINS = {"gmail.com": 0.38, "yahoo.com": 0.2, "hotmail.com": 0.16, "outlook.com": 0.14, "example.com": 0.12}
+
+def weighted(series):
+    counts = series.value_counts()
+    return counts.index.to_numpy(dtype=object), (counts / counts.sum()).to_numpy()
+
+@st.cache_resource
+def load_distributions():
+    # (values, probabilities) per column; uniform built-in lists if the backup csv is not deployed
+    for p in SAMPLE_DATA_PATHS:
+        if os.path.exists(p):
+            backup = pd.read_csv(p, usecols=['first_name', 'last_name', 'gender', 'address', 'registered_date', 'username'])
+            registered = pd.to_datetime(backup['registered_date'], utc=True, errors='coerce').dropna()
+            return {
+                'first_name_gender': weighted(backup['first_name'] + '|' + backup['gender']),
+                'last_name': weighted(backup['last_name']),
+                'country': weighted(backup['address'].str.split(', ').str[-1]),
+                'username': weighted(backup['username'].str.rstrip('0123456789')),
+                'registered_date': registered.dt.tz_localize(None).to_numpy(dtype='datetime64[s]'),
+            }
+
     first_names = ["Ratnesh", "Alice", "Bob", "Charlie", "David", "Eve", "Frank", "Grace", "Hannah", "Ivan"]
-    last_names = ["Singh", "Doe", "Smith", "Johnson", "Williams", "Brown", "Jones", "Miller", "Davis", "Garcia"]
-    genders = ["male", "female"]
-    domains = ["gmail.com", "yahoo.com", "hotmail.com", "outlook.com", "example.com"]
-    
-    for i in range(50):
-        fn = random.choice(first_names)
-        ln = random.choice(last_names)
-        g = random.choice(genders)
-        email = f"{fn.lower()}.{ln.lower()}@{random.choice(domains)}"
-        reg_date = base_time - datetime.timedelta(days=random.randint(0, 365*20)) # 20 years history
-        
-        users.append({
-            "username": f"{fn.lower()}{random.randint(100,999)}",
-            "first_name": fn,
-            "last_name": ln,
-            "gender": g,
-            "email": email,
-            "registered_date": reg_date
-        })
-        
-    df = pd.DataFrame(users)
-    count = 5432 + random.randint(1, 100) # Fake growing count
+    genders = ["male", "female", "male", "male", "male", "female", "male", "female", "female", "male"]
+    uniform = lambda values: (np.array(values, dtype=object), np.full(len(values), 1 / len(values)))
+    return {
+        'first_name_gender': uniform([f"{fn}|{g}" for fn, g in zip(first_names, genders)]),
+        'last_name': uniform(["Singh", "Doe", "Smith", "Johnson", "Williams", "Brown", "Jones", "Miller", "Davis", "Garcia"]),
+        'country': uniform(["India", "United States", "United Kingdom", "Germany", "Canada", "Australia"]),
+        'username': uniform(["silverfish", "angryfish", "sadtiger", "bigwolf", "tinyfish", "redmeercat"]),
+        'registered_date': None,
+    }
+
+def sample_categorical(rng, distribution, n):
+    # draws category codes once and builds the column without touching python objects per row
+    values, probabilities = distribution
+    return pd.Categorical.from_codes(rng.choice(len(values), size=n, p=probabilities), categories=values)
+
+@st.cache_resource(max_entries=len(DEMO_SAMPLE_SIZES))
+def generate_users(n, seed=DEMO_SEED):
+    # Vectorized generator, built once per (n, seed): every column is drawn as codes into a small table of
+    # values, and strings are only glued together for email and username. A million users takes under
+    # a second. Cached as a resource (no copy per rerun), so callers must not modify the frame.
+    rng = np.random.default_rng(seed)
+    dist = load_distributions()
+
+    # first name and gender are drawn together so they stay consistent
+    values, probabilities = dist['first_name_gender']
+    codes = rng.choice(len(values), size=n, p=probabilities)
+    first_names, genders = np.array([v.split('|') for v in values], dtype=object).T
+    first_name_values, first_name_codes = np.unique(first_names, return_inverse=True)
+    gender_values, gender_codes = np.unique(genders, return_inverse=True)
+
+    last_name = sample_categorical(rng, dist['last_name'], n)
+    domain = sample_categorical(rng, (np.array(list(DEMO_EMAIL_DOMAINS), dtype=object),
+                                      np.array(list(DEMO_EMAIL_DOMAINS.values()))), n)
+
+    # email = "first." + "last" + "@domain", with the pieces prepared once per distinct value
+    first_prefix = np.array([f"{name.lower()}." for name in first_names], dtype=object)
+    last_part = np.array([name.lower() for name in last_name.categories], dtype=object)
+    domain_suffix = np.array([f"@{d}" for d in domain.categories], dtype=object)
+    email = first_prefix[codes] + last_part[last_name.codes] + domain_suffix[domain.codes]
+
+    usernames, username_probabilities = dist['username']
+    suffixes = np.arange(100, 1000).astype(str).astype(object)
+    username = usernames[rng.choice(len(usernames), size=n, p=username_probabilities)] + suffixes[rng.integers(0, 900, size=n)]
+
+    if dist['registered_date'] is not None:
+        # resample the real registration dates, jittered by up to a day
+        registered = rng.choice(dist['registered_date'], size=n) + rng.integers(0, 86400, size=n).astype('timedelta64[s]')
+    else:
+        now = np.datetime64(datetime.datetime.now(), 's')
+        registered = now - rng.integers(0, DEMO_HISTORY_YEARS * 365 * 86400, size=n).astype('timedelta64[s]')
+    # the other columns are independent draws, so sorting the dates alone gives a newest-first frame
+    registered = np.sort(registered)[::-1]
+
+    return pd.DataFrame({
+        "username": username,
+        "first_name": pd.Categorical.from_codes(first_name_codes[codes], categories=first_name_values),
+        "last_name": last_name,
+        "gender": pd.Categorical.from_codes(gender_codes[codes], categories=gender_values),
+        "email": email,
+        "email_domain": domain,
+        "country": sample_categorical(rng, dist['country'], n),
+        "registered_date": registered,
+    })
+
+@st.cache_resource
+def get_demo_start():
+    return time.time()
+
+def get_data(session, sample_size=DEMO_SAMPLE_SIZES[1]):
+    # GENERATE FAKE DATA FOR DEMO: the count grows at a steady rate from when the app started
+    df = generate_users(sample_size)
+    count = DEMO_BASE_COUNT + int((time.time() - get_demo_start()) * DEMO_RECORDS_PER_SECOND)
     return count, df
 
 def get_docker_logs(container_name, lines=50):
@@ -237,6 +311,10 @@ with st.sidebar:
     else:
         st.error("🔴 System Offline: Check Containers")
     
+    st.markdown("### 📊 Sample Size")
+    sample_size = st.select_slider("Synthetic users", options=DEMO_SAMPLE_SIZES, value=DEMO_SAMPLE_SIZES[1],
+                                   format_func=lambda n: f"{n:,}")
+
     st.markdown("### 🔄 Auto-Refresh")
     auto_refresh = st.toggle("Enable Live Updates", value=False)
     if auto_refresh:
@@ -280,7 +358,7 @@ with tab1:
         # Fetch more data for better analysis
         # OPTIMIZED: Select ONLY necessary columns to avoid MessageSizeError (skipping 'picture' which is heavy)
         try:
-            count, df = get_data(session)
+            count, df = get_data(session, sample_size)
             # Replaced query logic with the mocked get_data returning full DF and count
         except Exception as e:
             st.error(f"Error fetching data: {e}")
@@ -305,12 +383,8 @@ with tab1:
 
         # --- Visualizations ---
         if not df.empty:
-            # Data Preprocessing
-            if 'registered_date' in df.columns:
-                df['registered_date'] = pd.to_datetime(df['registered_date'])
-            
-            if 'email' in df.columns:
-                df['email_domain'] = df['email'].apply(lambda x: x.split('@')[-1] if isinstance(x, str) else "Unknown")
+            # Data Preprocessing: the generator already returns parsed dates and the email domain, and its
+            # frame is shared between reruns, so nothing here writes to df
 
             # Row 1: Charts
             c1, c2 = st.columns(2)
@@ -318,7 +392,7 @@ with tab1:
             with c1:
                 st.markdown("### 🌍 Gender Distribution")
                 if 'gender' in df.columns:
-                    gender_counts = df['gender'].value_counts().reset_index()
+                    gender_counts = df['gender'].value_counts().loc[lambda c: c > 0].reset_index()
                     gender_counts.columns = ['gender', 'count']
                     fig = px.pie(gender_counts, values='count', names='gender', 
                                  color_discrete_sequence=['#00d4ff', '#00ff88', '#ff6b6b'],
@@ -346,8 +420,7 @@ with tab1:
                 st.markdown("### 📈 User Registration Timeline (By Year)")
                 
                 # OPTIMIZED: Group by Year to avoid creating millions of points for 20-year spans
-                df['year'] = df['registered_date'].dt.year
-                df_trend = df.groupby('year').size().reset_index(name='count')
+                df_trend = df['registered_date'].dt.year.value_counts().sort_index().rename_axis('year').reset_index(name='count')
                 
                 fig = px.area(df_trend, x='year', y='count', 
                               markers=True, line_shape='spline')